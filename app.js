@@ -15,6 +15,8 @@ const BP_META = { latest_path: '', title: '', highlights: [] };
 const FORECAST_META = { generatedAt: null };
 const STATE_MANAGER = window.StateManager || null;
 let BOOTSTRAP_INFLIGHT = false;
+// Set when sales data comes from month shards: { manifest, loaded: Map<month, shard>, pending: Map<month, Promise> }.
+let SALES_SHARDS = null;
 let APP_EVENTS_BOUND = false;
 
 function getDataUrl() {
@@ -24,6 +26,13 @@ function getDataUrl() {
   return base + joiner + 'v=' + Date.now();
 }
 
+function getSalesManifestUrl() {
+  const base = window.SALES_MANIFEST_URL || './data/sales/manifest.json';
+  if (/(?:\?|&)v=/.test(base)) return base;
+  const joiner = base.includes('?') ? '&' : '?';
+  return base + joiner + 'v=' + Date.now();
+}
+
 function getFinanceUrl() {
   const base = window.FINANCE_URL || './data/finance_latest.json';
   if (/(?:\?|&)v=/.test(base)) return base;
@@ -71,7 +80,62 @@ function parseJsonWithNaN(text) {
   return JSON.parse(out);
 }
 
+async function loadShardedData() {
+  if (!window.DataLoader || !DataLoader.fetchSalesManifest || window.SALES_MANIFEST_URL === false) return null;
+  const manifest = await DataLoader.fetchSalesManifest(getSalesManifestUrl());
+  if (!manifest || !manifest.months.length) return null;
+  const latest = manifest.months[manifest.months.length - 1];
+  const shards = await DataLoader.fetchSalesShards(manifest, [latest]);
+  SALES_SHARDS = { manifest, loaded: new Map(shards.map(s => [s.month, s])), pending: new Map() };
+  return { generatedAt: manifest.generatedAt, data: DataLoader.mergeSalesShards(manifest, shards) };
+}
+
+// Returns true when every shard overlapping the range is loaded; otherwise starts loading the
+// missing ones, merges them into DATA and calls onReady once they arrive.
+function ensureSalesRange(startDate, endDate, onReady) {
+  if (!SALES_SHARDS) return true;
+  const { manifest, loaded, pending } = SALES_SHARDS;
+  const missing = DataLoader.shardEntriesForRange(manifest, startDate, endDate).filter(e => !loaded.has(e.month));
+  if (!missing.length) return true;
+  const fresh = missing.filter(e => !pending.has(e.month));
+  if (fresh.length) {
+    const promise = DataLoader.fetchSalesShards(manifest, fresh);
+    fresh.forEach(e => pending.set(e.month, promise));
+  }
+  showDataStatus(true, '正在加载 ' + missing.map(e => e.month).join('、') + ' 数据…');
+  Promise.all(missing.map(e => pending.get(e.month))).then(results => {
+    results.forEach(shards => shards.forEach(s => { loaded.set(s.month, s); pending.delete(s.month); }));
+    applyLoadedShards();
+    updateDataStatusLine();
+    onReady();
+  }).catch(err => {
+    missing.forEach(e => pending.delete(e.month));
+    console.error(err);
+    showDataStatus(false, '分月数据加载失败，请刷新重试（F5）');
+  });
+  return false;
+}
+
+function applyLoadedShards() {
+  const merged = DataLoader.mergeSalesShards(SALES_SHARDS.manifest, [...SALES_SHARDS.loaded.values()]);
+  const normalized = normalizeData({ generatedAt: SALES_SHARDS.manifest.generatedAt, data: merged });
+  ['total', 'store', 'nonstore'].forEach(key => {
+    // Keep the segment objects: other modules hold references to DATA[key].
+    Object.assign(DATA[key], normalized.segments[key], { abnormal_orders: [] });
+  });
+  if (window.EvidenceTables) {
+    try {
+      EvidenceTables.init(Object.assign({}, normalized, { segments: DATA }));
+    } catch (e) {
+      console.error('EvidenceTables init failed:', e);
+    }
+  }
+}
+
 async function loadData() {
+  const sharded = await loadShardedData();
+  if (sharded) return sharded;
+  SALES_SHARDS = null;
   const url = getDataUrl();
   if (window.DataLoader) {
     return DataLoader.fetchJsonCached('sales', url, JSON.parse);
@@ -104,7 +168,8 @@ async function loadForecastData() {
 }
 
 function normalizeData(raw) {
-  const root = raw && raw.data ? raw.data : (raw || {});
+  let root = raw && raw.data ? raw.data : (raw || {});
+  if (window.DataLoader && DataLoader.expandSalesData) root = DataLoader.expandSalesData(root);
   const segments = {};
   ['total', 'store', 'nonstore'].forEach((key) => {
     const seg = root[key] || {};
@@ -119,6 +184,10 @@ function normalizeData(raw) {
       rows,
       monthly: seg.monthly || [],
       cat_monthly: seg.cat_monthly || [],
+      daily_cum: seg.daily_cum || null,
+      order_index: seg.order_index || [],
+      min_date: seg.min_date || null,
+      max_date: seg.max_date || null,
       products: seg.products || [],
       customers: seg.customers || [],
       new_customers: seg.new_customers || [],
@@ -468,6 +537,48 @@ function getRawRows(segKey) {
   return hasRawRows(segKey) ? DATA[segKey].rows : [];
 }
 
+// order_index rows: [start, lines, sales, gp, gp_adj, qty]; an order's lines are rows[start, start + lines)
+// of the same segment and its 单据编号 / 单据日期 come from rows[start]. Lookups are built lazily per index array.
+const ORDER_LOOKUP_CACHE = new WeakMap();
+function getOrderLookup(segKey) {
+  const index = DATA && DATA[segKey] ? DATA[segKey].order_index : null;
+  if (!index || !index.length || !hasRawRows(segKey)) return null;
+  let lookup = ORDER_LOOKUP_CACHE.get(index);
+  if (!lookup) {
+    const rows = getRawRows(segKey);
+    lookup = new Map();
+    index.forEach(e => {
+      const orderNo = rows[e[0]] ? rows[e[0]][ROW_IDX.order] : '';
+      if (!orderNo) return;
+      if (!lookup.has(orderNo)) lookup.set(orderNo, []);
+      lookup.get(orderNo).push(e);
+    });
+    ORDER_LOOKUP_CACHE.set(index, lookup);
+  }
+  return lookup;
+}
+
+function getOrderLines(segKey, orderNo) {
+  const rows = getRawRows(segKey);
+  const lookup = getOrderLookup(segKey);
+  if (!lookup) return rows.filter(r => r[ROW_IDX.order] === orderNo);
+  const out = [];
+  (lookup.get(orderNo) || []).forEach(e => {
+    for (let i = e[0]; i < e[0] + e[1]; i++) out.push(rows[i]);
+  });
+  return out;
+}
+
+function getOrderTotals(segKey, orderNo) {
+  const lookup = getOrderLookup(segKey);
+  const entries = lookup ? (lookup.get(orderNo) || []) : [];
+  if (!entries.length) return null;
+  const rows = getRawRows(segKey);
+  const out = { date: rows[entries[0][0]][ROW_IDX.date], lines: 0, sales: 0, gp: 0, gpAdj: 0, qty: 0 };
+  entries.forEach(e => { out.lines += e[1]; out.sales += e[2]; out.gp += e[3]; out.gpAdj += e[4]; out.qty += e[5]; });
+  return out;
+}
+
 function fmtWan(x) { const n = Number(x); if (!isFinite(n)) return ''; return (n / 10000).toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 }) + ' 万'; }
 function fmtYi(x) { const n = Number(x); if (!isFinite(n)) return ''; return (n / 1e8).toFixed(3) + ' 亿'; }
 function fmtNum(x) { const n = Number(x); if (!isFinite(n)) return ''; return n.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 }); }
@@ -475,6 +586,22 @@ function fmtPct(x) { const n = Number(x); if (!isFinite(n)) return ''; return n.
 function parseNumber(s) { if (s === null || s === undefined) return NaN; const t = String(s).replace(/,/g, '').replace(/%/g, '').trim(); const v = parseFloat(t); return isNaN(v) ? NaN : v; }
 function monthInRange(m, start, end) { if (!start || !end) return true; return (m >= start && m <= end); }
 function dateInRange(d, start, end) { if (!start || !end) return true; return (d >= start && d <= end); }
+function isWholeMonthRange(start, end) { if (!start || !end) return true; return start.slice(8) === '01' && end === monthEndDate(end.slice(0, 7)); }
+function _dayIndex(start, d) { return Math.round((Date.parse(d + 'T00:00:00Z') - Date.parse(start + 'T00:00:00Z')) / 86400000); }
+function rangeTotalsFromDaily(segKey, startDate, endDate) {
+  const cum = DATA && DATA[segKey] ? DATA[segKey].daily_cum : null;
+  if (!cum || !cum.start || !cum.days) return null;
+  const last = cum.days - 1;
+  const s = startDate ? Math.max(0, _dayIndex(cum.start, startDate)) : 0;
+  const e = endDate ? Math.min(last, _dayIndex(cum.start, endDate)) : last;
+  const out = { sales: 0, cost: 0, gp: 0, fee: 0, gpAdj: 0, qty: 0 };
+  if (isNaN(s) || isNaN(e) || s > e) return out;
+  const pick = (arr) => (arr[e] || 0) - (s > 0 ? (arr[s - 1] || 0) : 0);
+  out.sales = pick(cum.sales); out.cost = pick(cum.cost); out.gp = pick(cum.gp);
+  out.fee = pick(cum.fee); out.gpAdj = pick(cum.gp_adj); out.qty = pick(cum.qty);
+  return out;
+}
+function hasMonthlyCube(segKey) { return !!(DATA && DATA[segKey] && DATA[segKey].monthly && DATA[segKey].monthly.length); }
 function _toDateStart(s) { return s ? new Date(s + 'T00:00:00') : null; }
 function _toDateEnd(s) { return s ? new Date(s + 'T23:59:59') : null; }
 function getMonthWeight(month, startDate, endDate) {
@@ -1643,10 +1770,10 @@ function monthEndDate(month) {
 function deriveGlobalDateRange() {
   const seg = DATA && DATA.total ? DATA.total : null;
   if (!seg) return { startDate: '', endDate: '', text: '—' };
-  let startDate = '';
-  let endDate = '';
+  let startDate = SALES_SHARDS ? (seg.min_date || '') : '';
+  let endDate = SALES_SHARDS ? (seg.max_date || '') : '';
   const rows = seg.rows || [];
-  if (rows.length) {
+  if (!startDate && rows.length) {
     rows.forEach(r => {
       const d = r[ROW_IDX.date];
       if (!d) return;
@@ -1721,9 +1848,10 @@ function initDateRange(segKey) {
   const e = document.getElementById(segKey + '_d_end');
   if (!s || !e) return;
   const def = getDefaultDateRange(segKey);
+  const bounds = getDataBounds(segKey);
   if (!def.startDate || !def.endDate) return;
-  s.min = def.startDate; s.max = def.endDate;
-  e.min = def.startDate; e.max = def.endDate;
+  s.min = bounds.startDate; s.max = bounds.endDate;
+  e.min = bounds.startDate; e.max = bounds.endDate;
   s.value = def.startDate; e.value = def.endDate;
 }
 
@@ -1736,6 +1864,18 @@ function getRange(segKey) {
 }
 
 function getDefaultDateRange(segKey) {
+  const bounds = getDataBounds(segKey);
+  // Sharded data opens on the latest month so first paint needs a single shard.
+  if (SALES_SHARDS && bounds.endDate) {
+    const monthStart = bounds.endDate.slice(0, 7) + '-01';
+    return { startDate: monthStart > bounds.startDate ? monthStart : bounds.startDate, endDate: bounds.endDate };
+  }
+  return bounds;
+}
+
+function getDataBounds(segKey) {
+  const seg = DATA[segKey];
+  if (SALES_SHARDS && seg.min_date && seg.max_date) return { startDate: seg.min_date, endDate: seg.max_date };
   if (hasRawRows(segKey)) {
     const rows = getRawRows(segKey);
     if (rows.length) {
@@ -1748,6 +1888,16 @@ function getDefaultDateRange(segKey) {
   return { startDate: months[0] + '-01', endDate: monthEndDate(months[months.length - 1]) };
 }
 
+// Union of the segment range and any table ranges set for it: what updateSeg needs loaded.
+function getSegLoadRange(segKey) {
+  let { startDate, endDate } = getRange(segKey);
+  Object.values(TABLE_RANGE[segKey] || {}).forEach(r => {
+    if (r.startDate && (!startDate || r.startDate < startDate)) startDate = r.startDate;
+    if (r.endDate && (!endDate || r.endDate > endDate)) endDate = r.endDate;
+  });
+  return { startDate, endDate };
+}
+
 function getTableRange(segKey, type) {
   const def = getDefaultDateRange(segKey);
   const st = (TABLE_RANGE[segKey] && TABLE_RANGE[segKey][type]) || {};
@@ -1757,14 +1907,14 @@ function getTableRange(segKey, type) {
 }
 
 function syncTableRangeInputs(segKey, type) {
-  const def = getDefaultDateRange(segKey);
-  if (!def.startDate || !def.endDate) return;
+  const bounds = getDataBounds(segKey);
+  if (!bounds.startDate || !bounds.endDate) return;
   const range = getTableRange(segKey, type);
   const s = document.getElementById(segKey + '_' + type + '_d_start');
   const e = document.getElementById(segKey + '_' + type + '_d_end');
   if (!s || !e) return;
-  s.min = def.startDate; s.max = def.endDate;
-  e.min = def.startDate; e.max = def.endDate;
+  s.min = bounds.startDate; s.max = bounds.endDate;
+  e.min = bounds.startDate; e.max = bounds.endDate;
   s.value = range.startDate; e.value = range.endDate;
 }
 
@@ -1774,6 +1924,8 @@ function setTableRange(segKey, type, startDate, endDate) {
 }
 
 function rerenderTable(segKey, type) {
+  const range = getTableRange(segKey, type);
+  if (!ensureSalesRange(range.startDate, range.endDate, () => rerenderTable(segKey, type))) return;
   if (type === 'category') return renderCategory(segKey);
   if (type === 'product') return renderProducts(segKey);
   if (type === 'customer') return renderCustomers(segKey);
@@ -1856,6 +2008,8 @@ function showTab(segKey, tabKey) {
 }
 
 function updateSeg(segKey) {
+  const range = getSegLoadRange(segKey);
+  if (!ensureSalesRange(range.startDate, range.endDate, () => updateSeg(segKey))) return;
   renderKPIs(segKey);
   renderOverview(segKey);
   renderCategory(segKey);
@@ -1880,7 +2034,11 @@ function updateSeg(segKey) {
 function renderKPIs(segKey) {
   const { startDate, endDate, startMonth, endMonth } = getRange(segKey);
   let sales = 0, gp = 0, fee = 0, gpAdj = 0;
-  if (hasRawRows(segKey)) {
+  const useCube = hasMonthlyCube(segKey) && isWholeMonthRange(startDate, endDate);
+  const dailyTotals = rangeTotalsFromDaily(segKey, startDate, endDate);
+  if (dailyTotals) {
+    ({ sales, gp, fee, gpAdj } = dailyTotals);
+  } else if (hasRawRows(segKey) && !useCube) {
     const rows = getRawRows(segKey);
     rows.forEach(r => {
       const d = r[ROW_IDX.date];
@@ -3043,42 +3201,63 @@ function ensureAbnormalOrders(segKey) {
   if ((DATA[segKey].abnormal_orders || []).length || !hasRawRows(segKey)) return;
   const orders = new Map();
   const priceMap = new Map();
-  getRawRows(segKey).forEach(r => {
-    const date = r[ROW_IDX.date];
-    const orderNo = r[ROW_IDX.order];
-    if (!date || !orderNo) return;
-    const key = date + '||' + orderNo;
-    if (!orders.has(key)) {
-      orders.set(key, {
-        date,
-        orderNo,
-        cust: r[ROW_IDX.cust] || '',
-        cls: r[ROW_IDX.cls] || '',
-        sales: 0,
-        gpAdj: 0,
-        lines: 0,
-        qtyBad: false,
-        costBad: false,
-        priceDiff: false
-      });
-    }
-    const o = orders.get(key);
-    o.sales += Number(r[ROW_IDX.sales]) || 0;
-    o.gpAdj += Number(r[ROW_IDX.gpAdj]) || 0;
-    o.lines += 1;
+  const rows = getRawRows(segKey);
+  const checkLine = (r, key, o) => {
     const qty = Number(r[ROW_IDX.qty]);
     const cost = Number(r[ROW_IDX.cost]);
     if (!isFinite(qty) || qty <= 0) o.qtyBad = true;
     if (!isFinite(cost) || cost <= 0) o.costBad = true;
 
-    const pkey = date + '||' + (r[ROW_IDX.cust] || '') + '||' + (r[ROW_IDX.prod] || '');
+    const pkey = o.date + '||' + (r[ROW_IDX.cust] || '') + '||' + (r[ROW_IDX.prod] || '');
     if (!priceMap.has(pkey)) priceMap.set(pkey, { prices: new Set(), orders: new Set() });
     const pm = priceMap.get(pkey);
     const price = Number(r[ROW_IDX.unitPrice]);
     if (isFinite(price) && price > 0) pm.prices.add(price);
     pm.orders.add(key);
+  };
+  const newOrder = (date, orderNo, r) => ({
+    date,
+    orderNo,
+    cust: r[ROW_IDX.cust] || '',
+    cls: r[ROW_IDX.cls] || '',
+    sales: 0,
+    gpAdj: 0,
+    lines: 0,
+    qtyBad: false,
+    costBad: false,
+    priceDiff: false
   });
 
+  if (getOrderLookup(segKey)) {
+    // Order totals come precomputed; only the per-line checks walk each order's own rows.
+    DATA[segKey].order_index.forEach(e => {
+      const first = rows[e[0]];
+      const date = first[ROW_IDX.date];
+      const orderNo = first[ROW_IDX.order];
+      if (!date || !orderNo) return;
+      const key = date + '||' + orderNo;
+      if (!orders.has(key)) orders.set(key, newOrder(date, orderNo, first));
+      const o = orders.get(key);
+      o.sales += e[2];
+      o.gpAdj += e[4];
+      o.lines += e[1];
+      for (let i = e[0]; i < e[0] + e[1]; i++) checkLine(rows[i], key, o);
+    });
+  } else {
+    rows.forEach(r => {
+      const date = r[ROW_IDX.date];
+      const orderNo = r[ROW_IDX.order];
+      if (!date || !orderNo) return;
+      const key = date + '||' + orderNo;
+      if (!orders.has(key)) orders.set(key, newOrder(date, orderNo, r));
+      const o = orders.get(key);
+      o.sales += Number(r[ROW_IDX.sales]) || 0;
+      o.gpAdj += Number(r[ROW_IDX.gpAdj]) || 0;
+      o.lines += 1;
+      checkLine(r, key, o);
+    });
+  }
+
   priceMap.forEach(pm => {
     if (pm.prices.size > 1) {
       pm.orders.forEach(key => {
@@ -21,6 +21,98 @@
     return promise;
   }
 
+  // latest.json v2 (format: 2): columns 2..7 are codes into data.dict, and store/nonstore
+  // reference total rows by index. Expands back to the v1 row layout the dashboard uses.
+  const SALES_DICT_FIELDS = [['cust', 2], ['cls', 3], ['name', 4], ['spec', 5], ['label', 6], ['cat', 7]];
+
+  function expandSalesData(root){
+    if(!root || Number(root.format) !== 2 || !root.dict) return root;
+    const dict = root.dict;
+    const fields = SALES_DICT_FIELDS.map(([key, pos])=>[dict[key] || [], pos]);
+    const totalSeg = root.total || {};
+    const rows = (totalSeg.rows || []).map((r)=>{
+      const out = r.slice();
+      for(const [values, pos] of fields) out[pos] = values[r[pos]];
+      return out;
+    });
+    const out = Object.assign({}, root);
+    out.total = Object.assign({}, totalSeg, { rows });
+    ['store', 'nonstore'].forEach((key)=>{
+      const seg = root[key] || {};
+      const idx = seg.row_idx || [];
+      out[key] = Object.assign({}, seg, { rows: idx.map((i)=>rows[i]) });
+    });
+    return out;
+  }
+
+  // Month shards (data/sales/manifest.json + <YYYY-MM>.json): each shard is a latest.json-shaped
+  // payload for one month carrying rows plus its cat_monthly/products/customers cubes; the manifest
+  // carries the month list, per-shard hashes, and the whole-range monthly cube and daily_cum.
+  const SHARD_CUBES = ['cat_monthly', 'products', 'customers'];
+
+  function fetchSalesManifest(url){
+    return fetchJsonCached('sales-manifest', url).then((manifest)=>{
+      if(!manifest || manifest.format !== 'sales-shards' || !Array.isArray(manifest.months)) return null;
+      manifest.url = url;
+      return manifest;
+    }).catch(()=>null);
+  }
+
+  function shardEntriesForRange(manifest, startDate, endDate){
+    const startMonth = startDate ? String(startDate).slice(0, 7) : '';
+    const endMonth = endDate ? String(endDate).slice(0, 7) : '';
+    return manifest.months.filter((e)=>(!startMonth || e.month >= startMonth) && (!endMonth || e.month <= endMonth));
+  }
+
+  function fetchSalesShards(manifest, entries){
+    const base = new URL(manifest.url, window.location.href);
+    return Promise.all(entries.map((e)=>{
+      const url = new URL(e.file, base);
+      url.search = 'v=' + String(e.sha256 || '').slice(0, 12);
+      return fetchJsonCached('sales-shard:' + e.month + ':' + e.sha256, url.toString())
+        .then((shard)=>expandSalesData(shard));
+    }));
+  }
+
+  function mergeSalesShards(manifest, shards){
+    const ordered = shards.slice().sort((a, b)=>String(a.month).localeCompare(String(b.month)));
+    const root = {
+      category_meta: manifest.category_meta || {},
+      order_map: {},
+      order_map_catton: manifest.order_map_catton || {},
+      cat_ton: manifest.cat_ton || {},
+      cat_ton_meta: manifest.cat_ton_meta || {},
+      loaded_months: ordered.map((s)=>s.month)
+    };
+    ['total', 'store', 'nonstore'].forEach((key)=>{
+      const meta = (manifest.segments || {})[key] || {};
+      const seg = {
+        rows: [],
+        months: meta.months || [],
+        monthly: meta.monthly || [],
+        daily_cum: meta.daily_cum || null,
+        min_date: meta.min_date || null,
+        max_date: meta.max_date || null
+      };
+      SHARD_CUBES.forEach((cube)=>{ seg[cube] = []; });
+      seg.order_index = [];
+      ordered.forEach((shard)=>{
+        const part = shard[key] || {};
+        // order_index starts are shard-local row offsets; shift them past the rows merged so far.
+        const offset = seg.rows.length;
+        (part.rows || []).forEach((r)=>seg.rows.push(r));
+        SHARD_CUBES.forEach((cube)=>{ (part[cube] || []).forEach((r)=>seg[cube].push(r)); });
+        (part.order_index || []).forEach((e)=>{
+          const out = e.slice();
+          out[0] += offset;
+          seg.order_index.push(out);
+        });
+      });
+      root[key] = seg;
+    });
+    return root;
+  }
+
   function clear(key){
     if(typeof key === 'string'){
       cache.delete(key);
@@ -32,6 +124,11 @@
   window.DataLoader = {
     fetchTextCached,
     fetchJsonCached,
+    expandSalesData,
+    fetchSalesManifest,
+    shardEntriesForRange,
+    fetchSalesShards,
+    mergeSalesShards,
     clear
   };
 })();
@@ -204,6 +204,23 @@
     return base + joiner + 'v=' + Date.now();
   }
 
+  function getSalesManifestUrl() {
+    const base = window.SALES_MANIFEST_URL || './data/sales/manifest.json';
+    const joiner = base.includes('?') ? '&' : '?';
+    return base + joiner + 'v=' + Date.now();
+  }
+
+  // The report covers the whole period, so with month shards it loads all of them (shared cache with app.js).
+  function loadSalesData(loader) {
+    const full = () => loader.fetchJsonCached('sales', getDataUrl(), parseJsonWithNaN);
+    if (!loader.fetchSalesManifest || window.SALES_MANIFEST_URL === false) return full();
+    return loader.fetchSalesManifest(getSalesManifestUrl()).then((manifest) => {
+      if (!manifest || !manifest.months.length) return full();
+      return loader.fetchSalesShards(manifest, manifest.months)
+        .then(shards => ({ generatedAt: manifest.generatedAt, data: loader.mergeSalesShards(manifest, shards) }));
+    });
+  }
+
   function getFinanceUrl() {
     const base = './data/finance_latest.json';
     const joiner = base.includes('?') ? '&' : '?';
@@ -391,7 +408,8 @@
   }
 
   function normalizeData(raw) {
-    const root = raw && raw.data ? raw.data : (raw || {});
+    let root = raw && raw.data ? raw.data : (raw || {});
+    if (window.DataLoader && window.DataLoader.expandSalesData) root = window.DataLoader.expandSalesData(root);
     const segments = {};
     ['total', 'store', 'nonstore'].forEach((key) => {
       const seg = root[key] || {};
@@ -4318,7 +4336,7 @@
     try {
       const loader = window.DataLoader;
       const dataPromise = loader
-        ? loader.fetchJsonCached('sales', getDataUrl(), parseJsonWithNaN)
+        ? loadSalesData(loader)
         : fetch(getDataUrl(), { cache: 'no-store' }).then(r => r.text()).then(parseJsonWithNaN);
       const financePromise = loader
         ? loader.fetchJsonCached('finance', getFinanceUrl(), parseJsonWithNaN)
@@ -1,18 +1,75 @@
+import argparse
+import glob
+import hashlib
 import json
+import os
+import pickle
 import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from xml.parsers import expat
 import openpyxl
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.datetime import from_excel, CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+from openpyxl.xml.functions import fromstring
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+import parse_cache  # noqa: E402  shared with tools/build_finance_package.py
+from keyword_rules import KeywordRules  # noqa: E402  shared with tools/build_finance_package.py
 
 SRC = Path('/Users/russell/Downloads/销售利润表-20251222111220.xlsx')
 OUT = Path('data/latest.json')
 OLD = Path('data/latest.json')
+STATE = Path('data/latest_state.json')
+STATE_VERSION = 1
+SHARD_DIR = Path('data/sales')
+SHARD_MANIFEST = SHARD_DIR / 'manifest.json'
+SHARD_VERSION = 1
+SHARD_NAME_RE = re.compile(r'^\d{4}-\d{2}\.json$')
+# Month-keyed cubes that are split across shards; `monthly` and `daily_cum` stay whole in the manifest.
+SHARD_CUBES = ('cat_monthly', 'products', 'customers')
+SEGMENTS = ['total', 'store', 'nonstore']
+
+# Overlapping exports (per day / per store) are merged on this line identity:
+# 单据编号, 商品名称, 规格型号, 数量, 价税合计.
+DEDUP_COLS = (1, 4, 5, 8, 9)
+
+DAILY_CUM_COLS = ['sales', 'cost', 'gp', 'fee', 'gp_adj', 'qty']
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# v2 output: these row columns are written as integer codes into data.dict[<key>].
+DICT_FIELDS = [('cust', 2), ('cls', 3), ('name', 4), ('spec', 5), ('label', 6), ('cat', 7)]
+
+# Row 1 of the export is a title, row 2 the header, data starts at row 3.
+HEADER_ROW = 2
+# Columns parse_row() reads; the streaming reader decodes only these (plus column A).
+SOURCE_FIELDS = ['单据日期', '单据编号', '客户名称', '客户分类', '商品名称', '规格型号', '数量', '价税合计', '成本',
+                 '关联销售费用', '销售毛利', '实际含税单价']
+
+SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# Category mapping based on product name/spec keywords, first matching rule wins.
+CATEGORY_RULES = Path(__file__).resolve().with_name('category_rules.json')
 
-# Category mapping based on product name/spec keywords.
-RICE_KEYS = ['大米','粳米','籼米','香米','稻花香','长粒香','米']
-OIL_KEYS = ['油','脂']
-FLOUR_KEYS = ['面粉','小麦粉']
-GRAIN_KEYS = ['杂粮','玉米','小米','高粱','荞麦','藜麦','黑米','红豆','绿豆','黄豆','薏米','燕麦','芸豆']
+# 吨位口径: 规格型号 volumes are converted with the oil density; bags without a weight use the fallback.
+OIL_DENSITY = 0.92
+FALLBACK_BAG_KG = 1
+LIQUID_CATEGORIES = ('食用油',)
+WEIGHT_UNITS_KG = {'kg': 1.0, '公斤': 1.0, '千克': 1.0, '斤': 0.5, 'g': 0.001, '克': 0.001}
+VOLUME_UNITS_L = {'l': 1.0, '升': 1.0, 'ml': 0.001, '毫升': 0.001}
+_UNIT_ALT = '|'.join(sorted(list(WEIGHT_UNITS_KG) + list(VOLUME_UNITS_L), key=len, reverse=True))
+SPEC_TOKEN_RE = re.compile(rf'(\d+(?:\.\d+)?)?\s*({_UNIT_ALT})?', re.I)
+SPEC_AMOUNT_RE = re.compile(rf'(\d+(?:\.\d+)?)\s*({_UNIT_ALT})', re.I)
+SPEC_SPLIT_RE = re.compile(r'\s*[*×xX]\s*')
 
 
 def to_date_str(val):
@@ -49,110 +106,1347 @@ def product_label(name, spec):
     return name
 
 
+class Categorizer(KeywordRules):
+    """Product category rules (keyword_rules.KeywordRules), memoized per distinct (name, spec)."""
+
+    label_key = 'category'
+    default_label = '其他'
+
+    def categorize(self, name, spec):
+        key = (norm_text(name), norm_text(spec))
+        cat = self._memo.get(key)
+        if cat is None:
+            cat = self._memo[key] = self.classify(f"{key[0]} {key[1]}")
+        return cat
+
+    def report(self, hits, distinct_products):
+        """category_meta from counts taken on the rows written (SalesJsonWriter), not on the rows
+        parsed: kept rows of an incremental build count, lines dropped as duplicates do not."""
+        counts = dict.fromkeys(self.hits, 0)
+        counts.update(hits)
+        return {
+            'rules_version': self.version,
+            'distinct_products': distinct_products,
+            'hits': counts,
+        }
+
+
+_CATEGORIZER = None
+
+
+def get_categorizer():
+    global _CATEGORIZER
+    if _CATEGORIZER is None:
+        _CATEGORIZER = Categorizer.from_file(CATEGORY_RULES)
+    return _CATEGORIZER
+
+
 def category_of(name, spec):
-    text = f"{norm_text(name)} {norm_text(spec)}"
-    if any(k in text for k in FLOUR_KEYS):
-        return '面粉'
-    if any(k in text for k in GRAIN_KEYS):
-        return '杂粮'
-    # avoid classifying 酱油 as 食用油
-    if '酱油' not in text and any(k in text for k in OIL_KEYS):
-        return '食用油'
-    if any(k in text for k in RICE_KEYS):
-        return '大米'
-    return '其他'
-
-
-def load_old_meta():
+    return get_categorizer().categorize(name, spec)
+
+
+class UnsupportedWorkbook(Exception):
+    """Raised by the streaming reader for constructs it does not handle; callers fall back to openpyxl."""
+
+
+_COLUMN_CACHE = {}
+
+
+def _column_index(ref):
+    letters = ref.rstrip('0123456789')
+    idx = _COLUMN_CACHE.get(letters)
+    if idx is None:
+        n = 0
+        for ch in letters:
+            n = n * 26 + ord(ch) - 64
+        idx = _COLUMN_CACHE[letters] = n - 1
+    return idx
+
+
+def _cast_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+def _first_sheet_part(zf):
+    wb = fromstring(zf.read('xl/workbook.xml'))
+    if wb.tag != f'{{{SHEET_NS}}}workbook':
+        raise UnsupportedWorkbook(f'unexpected workbook namespace: {wb.tag}')
+    pr = wb.find(f'{{{SHEET_NS}}}workbookPr')
+    date1904 = pr is not None and pr.get('date1904') in ('1', 'true')
+    sheet = wb.find(f'{{{SHEET_NS}}}sheets/{{{SHEET_NS}}}sheet')
+    if sheet is None:
+        raise UnsupportedWorkbook('workbook has no sheets')
+    rid = sheet.get(f'{{{REL_NS}}}id')
+    rels = fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{{{PKG_REL_NS}}}Relationship'):
+        if rel.get('Id') == rid:
+            target = rel.get('Target', '')
+            part = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+            return part, date1904
+    raise UnsupportedWorkbook(f'sheet relationship {rid} not found')
+
+
+class _SheetHandler:
+    """expat callbacks for one worksheet: collects decoded cells of the wanted columns per row."""
+
+    def __init__(self, shared, date_styles, epoch):
+        self.shared = shared
+        self.date_styles = date_styles
+        self.epoch = epoch
+        self.wanted = None
+        self.rows = []
+        self.row_no = 0
+        self.values = None
+        self.col = -1
+        self.cell = None
+        self.text = None
+        self.in_phonetic = False
+
+    def start(self, tag, attrs):
+        if tag == 'worksheet':
+            if attrs.get('xmlns') != SHEET_NS:
+                raise UnsupportedWorkbook('worksheet without the default spreadsheetml namespace')
+        elif tag == 'c':
+            ref = attrs.get('r')
+            self.col = _column_index(ref) if ref else self.col + 1
+            if self.values is not None and (self.wanted is None or self.col in self.wanted):
+                self.cell = (self.col, attrs.get('t', 'n'), attrs.get('s'), ref)
+                self.text = []
+        elif tag == 'row':
+            r = attrs.get('r')
+            self.row_no = int(r) if r else self.row_no + 1
+            self.col = -1
+            self.values = {} if self.row_no >= HEADER_ROW else None
+        elif tag == 'rPh':
+            self.in_phonetic = True
+        elif tag == 'f' and self.cell is not None:
+            self.cell = self.cell + ('f',)
+
+    def end(self, tag):
+        if tag == 'c':
+            if self.cell is not None:
+                self.values[self.cell[0]] = self._decode(self.cell, ''.join(self.text))
+                self.cell = None
+        elif tag == 'row':
+            if self.values is not None:
+                self.rows.append(self.values)
+            self.values = None
+        elif tag == 'rPh':
+            self.in_phonetic = False
+
+    def data(self, text):
+        if self.cell is not None and not self.in_phonetic:
+            self.text.append(text)
+
+    def _decode(self, cell, text):
+        col, t, style, ref = cell[:4]
+        if t == 'inlineStr':
+            return text
+        if not text:
+            if len(cell) > 4 and t not in ('n', 'str'):
+                raise UnsupportedWorkbook(f'formula cell {ref} without cached value')
+            return None
+        if t == 'n':
+            value = _cast_number(text)
+            if style and int(style) in self.date_styles:
+                value = from_excel(value, self.epoch)
+            return value
+        if t == 's':
+            return self.shared[int(text)]
+        if t == 'b':
+            return bool(int(text))
+        if t in ('str', 'e'):
+            return text
+        raise UnsupportedWorkbook(f'cell type {t!r} at {ref}')
+
+
+def iter_rows_stream(path):
+    """Stream the first sheet straight from the zip with an expat (SAX) parser.
+
+    Starts at the header row. The header row is decoded in full; after that only
+    column A and the SOURCE_FIELDS columns are decoded, everything else stays None.
+    Shared strings and date styles are read with openpyxl's own parsers so values
+    match the openpyxl path.
+    """
+    try:
+        zf = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as exc:
+        raise UnsupportedWorkbook(str(exc)) from exc
+    with zf:
+        names = set(zf.namelist())
+        part, date1904 = _first_sheet_part(zf)
+        if part not in names:
+            raise UnsupportedWorkbook(f'sheet part missing: {part}')
+        shared = []
+        if 'xl/sharedStrings.xml' in names:
+            with zf.open('xl/sharedStrings.xml') as f:
+                shared = read_string_table(f)
+        date_styles = set()
+        if 'xl/styles.xml' in names:
+            stylesheet = Stylesheet.from_tree(fromstring(zf.read('xl/styles.xml')))
+            if stylesheet.timedelta_formats:
+                raise UnsupportedWorkbook('timedelta number formats')
+            date_styles = stylesheet.date_formats
+        epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        handler = _SheetHandler(shared, date_styles, epoch)
+        # Tags are matched by their raw (unprefixed) names, which is what Excel and
+        # most writers emit; sheets using a prefixed namespace are rejected above.
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = handler.start
+        parser.EndElementHandler = handler.end
+        parser.CharacterDataHandler = handler.data
+
+        width = 0
+        with zf.open(part) as f:
+            while True:
+                chunk = f.read(1 << 16)
+                parser.Parse(chunk, not chunk)
+                for values in handler.rows:
+                    if handler.wanted is None:
+                        header = [values.get(i) for i in range(max(values) + 1)] if values else []
+                        handler.wanted = {0} | {i for i, name in enumerate(header) if name in SOURCE_FIELDS}
+                        width = max(handler.wanted) + 1
+                        yield tuple(header)
+                        continue
+                    yield tuple(values.get(i) for i in range(width))
+                handler.rows = []
+                if not chunk:
+                    break
+        if handler.wanted is None:
+            raise UnsupportedWorkbook(f'no header row {HEADER_ROW} in {part}')
+
+
+def iter_rows_openpyxl(path):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[wb.sheetnames[0]]
+        yield from ws.iter_rows(min_row=HEADER_ROW, values_only=True)
+    finally:
+        wb.close()
+
+
+READERS = {'stream': iter_rows_stream, 'openpyxl': iter_rows_openpyxl}
+
+
+def iter_raw(path, reader):
+    """Decode one export with the given backend: yields the header cells, then each raw row tuple."""
+    rows_iter = READERS[reader](path)
+    yield list(next(rows_iter, None) or [])
+    for r in rows_iter:
+        if r and r[0] is not None:
+            yield r
+
+
+def read_raw(path, reader):
+    """Decode one export with the given backend: (header cells, list of raw row tuples)."""
+    items = iter_raw(path, reader)
+    cols = next(items)
+    return cols, list(items)
+
+
+def read_raw_auto(path, reader='auto'):
+    if reader != 'auto':
+        return read_raw(path, reader)
+    try:
+        return read_raw(path, 'stream')
+    except UnsupportedWorkbook as exc:
+        print(f"Streaming reader unsupported for {path} ({exc}), falling back to openpyxl")
+        return read_raw(path, 'openpyxl')
+
+
+def iter_source(cols, raw_rows, state=None):
+    """Turn raw export rows into row lists, lazily.
+
+    Returns (header names, since, row iterator). `state['since']` (a 单据日期) is applied only
+    when the header layout still matches; rows dated before it are skipped on a cheap date check.
+    """
+    idx = {name: i for i, name in enumerate(cols)}
+    col_names = [norm_text(c) for c in cols]
+
+    since = None
+    if state and state.get('columns') == col_names and state.get('since'):
+        since = state['since']
+
+    def rows():
+        for r in raw_rows:
+            if since is not None and to_date_str(r[idx['单据日期']]) < since:
+                continue
+            row = parse_row(r, idx)
+            if row is not None:
+                yield row
+    return col_names, since, rows()
+
+
+def read_source(cols, raw_rows, state=None):
+    """iter_source() collected into a list: (header names, rows, since)."""
+    col_names, since, rows = iter_source(cols, raw_rows, state)
+    return col_names, list(rows), since
+
+
+# Temp row files are consecutive pickled lists of at most ROW_CHUNK rows.
+ROW_CHUNK = 2000
+
+
+def write_row_file(path, rows):
+    with Path(path).open('wb') as f:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= ROW_CHUNK:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                chunk = []
+        if chunk:
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_row_file(path):
+    with Path(path).open('rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def spool_source(path, out, reader='auto', state=None):
+    """Parse one export straight into the row file `out`; returns (header names, since).
+
+    Raw rows stream from the reader (or a parse-cache hit) through parse_row() to disk, so no
+    row list is built. With reader='auto' a workbook the streaming reader rejects part-way is
+    parsed again with openpyxl.
+    """
+    # Both backends decode identical tuples, so the reader choice is not part of the cache key.
+    params = {'reader': 'daily_raw', 'layout': 'chunks', 'header_row': HEADER_ROW, 'fields': sorted(SOURCE_FIELDS)}
+    backends = ['stream', 'openpyxl'] if reader == 'auto' else [reader]
+    for i, backend in enumerate(backends):
+        try:
+            items = parse_cache.cached_iter(path, params, lambda: iter_raw(path, backend))
+            col_names, since, rows = iter_source(next(items), items, state)
+            write_row_file(out, rows)
+            return col_names, since
+        except UnsupportedWorkbook as exc:
+            if i + 1 == len(backends):
+                raise
+            print(f"Streaming reader unsupported for {path} ({exc}), falling back to openpyxl")
+
+
+def bench_readers(path, repeat=3):
+    """Time both reader backends on the same file and check they produce identical rows."""
+    results = {}
+    for reader in ('openpyxl', 'stream'):
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            _, rows, _ = read_source(*read_raw(path, reader))
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        results[reader] = (best, rows)
+    base_time, base_rows = results['openpyxl']
+    for reader, (elapsed, rows) in results.items():
+        rate = len(rows) / elapsed if elapsed else 0
+        print(f"{reader:9s} {elapsed:8.3f}s  {len(rows)} rows  {rate:,.0f} rows/s  x{base_time / elapsed:.2f}")
+    print('identical rows:', results['stream'][1] == base_rows)
+
+
+def resolve_sources(spec):
+    """--src may be a workbook, a directory of workbooks or a glob; returns paths sorted by name."""
+    p = Path(spec)
+    if p.is_dir():
+        paths = [x for x in p.glob('*.xlsx') if not x.name.startswith('~$')]
+    elif p.exists():
+        paths = [p]
+    else:
+        paths = [Path(x) for x in glob.glob(spec) if Path(x).is_file()]
+    return sorted(paths, key=str)
+
+
+def _init_worker(rules_path, cache_enabled, cache_dir):
+    global _CATEGORIZER
+    _CATEGORIZER = Categorizer.from_file(rules_path)
+    parse_cache.configure(enabled=cache_enabled, cache_dir=cache_dir)
+
+
+def _parse_file(task):
+    path, out, reader, state = task
+    return spool_source(path, out, reader, state)
+
+
+def parse_sources(paths, reader, state, workers, rules_path, tmpdir):
+    """Parse every export into its own row file under `tmpdir`, in a process pool when there is
+    more than one; returns (header names, row file, since) per export, in `paths` order."""
+    outs = [Path(tmpdir) / f'source-{i}.rows' for i in range(len(paths))]
+    workers = min(len(paths), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        results = [spool_source(p, out, reader, state) for p, out in zip(paths, outs)]
+    else:
+        cfg = parse_cache._config
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(str(rules_path), cfg['enabled'], str(cfg['dir']))) as pool:
+            results = list(pool.map(_parse_file, [(p, out, reader, state) for p, out in zip(paths, outs)]))
+    return [(col_names, out, since) for (col_names, since), out in zip(results, outs)]
+
+
+def merge_sources(parsed, add):
+    """Pass per-file rows to `add` in order, dropping lines another export already contributed.
+
+    A line key (DEDUP_COLS) is kept as many times as it occurs in the single export that has it
+    most often, so repeated lines inside one export survive while overlaps between exports do not.
+    `parsed` holds one row iterable per export; returns (rows kept, rows dropped).
+    """
+    if len(parsed) == 1:
+        n = 0
+        for row in parsed[0]:
+            add(row)
+            n += 1
+        return n, 0
+    kept = {}
+    merged = 0
+    dropped = 0
+    for rows in parsed:
+        local = {}
+        for row in rows:
+            key = tuple(row[i] for i in DEDUP_COLS)
+            local[key] = local.get(key, 0) + 1
+            if local[key] > kept.get(key, 0):
+                kept[key] = local[key]
+                add(row)
+                merged += 1
+            else:
+                dropped += 1
+    return merged, dropped
+
+
+def sources_fingerprint(paths):
+    if len(paths) == 1:
+        return file_fingerprint(paths[0])
+    files = [file_fingerprint(p) for p in paths]
+    combined = hashlib.sha256('\n'.join(f"{f['path']}:{f['sha256']}" for f in files).encode('utf-8'))
+    return {'files': files, 'sha256': combined.hexdigest()}
+
+
+def file_fingerprint(path):
+    h = hashlib.sha256()
+    with Path(path).open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    st = Path(path).stat()
+    return {'path': str(path), 'size': st.st_size, 'mtime': int(st.st_mtime), 'sha256': h.hexdigest()}
+
+
+def load_state():
+    if not STATE.exists():
+        return None
+    try:
+        with STATE.open('r', encoding='utf-8') as f:
+            state = json.load(f)
+    except Exception:
+        return None
+    if state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+
+def build_settings(args):
+    """The arguments that shape latest.json plus the category rule set in use. An incremental run
+    whose settings differ from the stored ones rebuilds in full: the kept rows carry categories
+    and the output format / shards / tonnage of the previous settings."""
+    rules = Path(args.category_rules)
+    return {
+        'format': args.format,
+        'shards': args.shards,
+        'oil_density': args.oil_density,
+        'fallback_bag_kg': args.fallback_bag_kg,
+        'category_rules': {
+            'version': get_categorizer().version,
+            'sha256': hashlib.sha256(rules.read_bytes()).hexdigest(),
+        },
+    }
+
+
+def save_state(source, settings, columns, watermark, row_count):
+    state = {
+        'version': STATE_VERSION,
+        'source': source,
+        'settings': settings,
+        'columns': columns,
+        'watermark': watermark,
+        'row_count': row_count,
+        'updatedAt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    STATE.parent.mkdir(parents=True, exist_ok=True)
+    STATE.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+def incremental_since(state, lookback_days=0):
+    """First 单据日期 to re-parse: the watermark's date (lines can still arrive for that day, with any
+    单据编号), moved back `lookback_days` so recent edits to earlier days are picked up too."""
+    wm = (state or {}).get('watermark') or {}
+    if not wm.get('date'):
+        return None
+    return (date.fromisoformat(wm['date']) - timedelta(days=max(0, lookback_days))).isoformat()
+
+
+def encode_rows(rows):
+    codes = {key: {} for key, _ in DICT_FIELDS}
+    out = []
+    for row in rows:
+        enc = list(row)
+        for key, pos in DICT_FIELDS:
+            table = codes[key]
+            code = table.get(row[pos])
+            if code is None:
+                code = table[row[pos]] = len(table)
+            enc[pos] = code
+        out.append(enc)
+    return out, {key: list(table) for key, table in codes.items()}
+
+
+def decode_rows(rows, dicts):
+    out = []
+    for row in rows:
+        dec = list(row)
+        for key, pos in DICT_FIELDS:
+            dec[pos] = dicts[key][row[pos]]
+        out.append(dec)
+    return out
+
+
+def build_segments_payload(segments, months, fmt):
+    if fmt == 'v1':
+        return {key: {'rows': segments[key], 'months': sorted(months[key])} for key in SEGMENTS}
+    rows, dicts = encode_rows(segments['total'])
+    store_idx = [i for i, row in enumerate(segments['total']) if row[3] == '超群门店']
+    store_set = set(store_idx)
+    nonstore_idx = [i for i in range(len(rows)) if i not in store_set]
+    return {
+        'format': 2,
+        'dict': dicts,
+        'total': {'rows': rows, 'months': sorted(months['total'])},
+        'store': {'row_idx': store_idx, 'months': sorted(months['store'])},
+        'nonstore': {'row_idx': nonstore_idx, 'months': sorted(months['nonstore'])},
+    }
+
+
+def _round_measures(vals):
+    sales, cost, gp, fee, gp_adj, qty = vals
+    return [round(sales, 2), round(cost, 2), round(gp, 2), round(fee, 2), round(gp_adj, 2), round(qty, 4)]
+
+
+class Rollups:
+    """Month, month×category, month×customer and month×product cubes, accumulated row by row.
+
+    Row layouts match what app.js reads when raw rows are absent:
+      monthly     [month, sales, cost, gp, fee, gp_adj, qty, active_customers, orders, lines]
+      cat_monthly [month, cat, sales, cost, gp, fee, gp_adj, qty, orders, lines]
+      customers   [cust, cls, month, sales, cost, gp, fee, gp_adj, qty, orders, lines]
+      products    [prod_label, cat, month, sales, cost, gp, fee, gp_adj, qty, orders, lines]
+    """
+
+    def __init__(self):
+        self.cubes = {'monthly': {}, 'cat_monthly': {}, 'customers': {}, 'products': {}}
+        self.active = {}
+
+    def add(self, row):
+        month = row[0][:7]
+        keys = (
+            ('monthly', (month,)),
+            ('cat_monthly', (month, row[7])),
+            ('customers', (row[2], row[3], month)),
+            ('products', (row[6], row[7], month)),
+        )
+        measures = (row[9], row[10], row[12], row[11], row[13], row[8])
+        for cube, key in keys:
+            acc = self.cubes[cube].get(key)
+            if acc is None:
+                acc = self.cubes[cube][key] = [[0.0] * 6, set(), 0]
+            vals = acc[0]
+            for i, v in enumerate(measures):
+                vals[i] += v
+            if row[1]:
+                acc[1].add(row[1])
+            acc[2] += 1
+        if row[2]:
+            self.active.setdefault(month, set()).add(row[2])
+
+    def result(self):
+        out = {}
+        for cube, accs in self.cubes.items():
+            items = []
+            for key in sorted(accs):
+                vals, orders, lines = accs[key]
+                measures = _round_measures(vals)
+                if cube == 'monthly':
+                    items.append([key[0]] + measures + [len(self.active.get(key[0], ())), len(orders), lines])
+                else:
+                    items.append(list(key) + measures + [len(orders), lines])
+            out[cube] = items
+        return out
+
+
+class OrderIndex:
+    """Per-order runs over a segment's rows: [start, lines, sales, gp, gp_adj, qty].
+
+    Rows are written sorted by (单据日期, 单据编号), so each order is one contiguous run and its
+    lines are rows[start:start + lines] of the same segment; 单据编号 and 单据日期 are read from
+    rows[start] rather than repeated here.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.pos = 0
+        self._last = None
+
+    def add(self, row):
+        key = (row[0], row[1])
+        if key != self._last:
+            self.entries.append([self.pos, 0, 0.0, 0.0, 0.0, 0.0])
+            self._last = key
+        entry = self.entries[-1]
+        entry[1] += 1
+        entry[2] += row[9]
+        entry[3] += row[12]
+        entry[4] += row[13]
+        entry[5] += row[8]
+        self.pos += 1
+
+    def result(self):
+        return [e[:2] + [round(e[2], 2), round(e[3], 2), round(e[4], 2), round(e[5], 4)] for e in self.entries]
+
+
+def build_order_index(rows):
+    index = OrderIndex()
+    for row in rows:
+        index.add(row)
+    return index.result()
+
+
+def build_rollups(rows):
+    rollups = Rollups()
+    for row in rows:
+        rollups.add(row)
+    return rollups.result()
+
+
+class DailyTotals:
+    """Per-day prefix sums over a contiguous calendar from the first to the last 单据日期.
+
+    Entry i holds totals from `start` through start + i days inclusive, so any date range
+    total is cum[end] - cum[start - 1].
+    """
+
+    def __init__(self):
+        self.daily = {}
+
+    def add(self, row):
+        acc = self.daily.get(row[0])
+        if acc is None:
+            acc = self.daily[row[0]] = [0.0] * 6
+        acc[0] += row[9]
+        acc[1] += row[10]
+        acc[2] += row[12]
+        acc[3] += row[11]
+        acc[4] += row[13]
+        acc[5] += row[8]
+
+    def result(self):
+        daily = self.daily
+        out = {'start': None, 'days': 0}
+        out.update({k: [] for k in DAILY_CUM_COLS})
+        days = sorted(d for d in daily if DATE_RE.match(d))
+        if not days:
+            return out
+        start = datetime.strptime(days[0], '%Y-%m-%d').date()
+        end = datetime.strptime(days[-1], '%Y-%m-%d').date()
+        running = [0.0] * 6
+        cur = start
+        while cur <= end:
+            acc = daily.get(cur.strftime('%Y-%m-%d'))
+            if acc:
+                for i, v in enumerate(acc):
+                    running[i] += v
+            for i, key in enumerate(DAILY_CUM_COLS):
+                out[key].append(round(running[i], 4 if key == 'qty' else 2))
+            cur += timedelta(days=1)
+        out['start'] = days[0]
+        out['days'] = len(out['sales'])
+        return out
+
+
+def build_daily_cum(rows):
+    totals = DailyTotals()
+    for row in rows:
+        totals.add(row)
+    return totals.result()
+
+
+class SpecWeights:
+    """Per-unit weight in kg from 规格型号 (falling back to 商品名称), memoized per distinct (spec, name, cat).
+
+    A spec is `amount unit` tokens joined by * / ×, where bare numbers are pack counts:
+    25kg, 50斤, 16.4L, 10L*2, 5L*4, 1*400g. Volumes use the oil density; a bare number is
+    read as litres for liquid categories. Bags with no parsable weight count as fallback_bag_kg,
+    anything else is None (a missing-weight line).
+    """
+
+    def __init__(self, oil_density=OIL_DENSITY, fallback_bag_kg=FALLBACK_BAG_KG):
+        self.oil_density = oil_density
+        self.fallback_bag_kg = fallback_bag_kg
+        self._memo = {}
+
+    def _unit_kg(self, amount, unit):
+        unit = unit.lower()
+        if unit in WEIGHT_UNITS_KG:
+            return amount * WEIGHT_UNITS_KG[unit]
+        return amount * VOLUME_UNITS_L[unit] * self.oil_density
+
+    def parse(self, text, liquid=False):
+        """kg per unit for a spec-like string, or None when it carries no weight."""
+        text = norm_text(text)
+        if not text:
+            return None
+        base = None
+        packs = None
+        for token in SPEC_SPLIT_RE.split(text):
+            m = SPEC_TOKEN_RE.fullmatch(token)
+            if m is None or not (m.group(1) or m.group(2)) or (m.group(2) and base is not None):
+                break
+            amount = float(m.group(1)) if m.group(1) else 1.0
+            if m.group(2):
+                base = self._unit_kg(amount, m.group(2))
+            else:
+                packs = amount * (packs or 1.0)
+        else:
+            if base is None and packs is not None and liquid:
+                return packs * self.oil_density
+            if base is not None:
+                return base * (packs or 1.0)
+        # Free text such as 商品名称 "25kg五得利超精粉": first amount with a unit.
+        m = SPEC_AMOUNT_RE.search(text)
+        return self._unit_kg(float(m.group(1)), m.group(2)) if m else None
+
+    def kg(self, name, spec, cat):
+        key = (spec, name, cat)
+        kg = self._memo.get(key, False)
+        if kg is False:
+            liquid = cat in LIQUID_CATEGORIES
+            kg = self.parse(spec, liquid)
+            if kg is None:
+                kg = self.parse(name, liquid)
+            if kg is None and ('袋' in norm_text(spec) or norm_text(name).startswith('袋装')):
+                kg = self.fallback_bag_kg
+            self._memo[key] = kg
+        return kg
+
+
+def iso_week(day):
+    """(week start, week end, label) for a YYYY-MM-DD date; weeks run Monday..Sunday."""
+    d = datetime.strptime(day, '%Y-%m-%d').date()
+    start = d - timedelta(days=d.weekday())
+    end = start + timedelta(days=6)
+    year, week, _ = d.isocalendar()
+    label = f"{year}-W{week:02d} ({start.strftime('%m-%d')}～{end.strftime('%m-%d')})"
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'), label
+
+
+class CatTonnage:
+    """Category tonnage by ISO week and month plus the orders behind each cell, for the 吨位 chart.
+
+    Row layouts match app.js renderCatTon / getOrderList('catton'):
+      weekly  [week_start, week_end, label, cat, tons, profit, profit_per_ton, orders]
+      monthly [month, cat, tons, profit, profit_per_ton, orders]
+      order_map_catton {'week': {'<week_start>||<cat>': [单据编号]}, 'month': {'<YYYY-MM>||<cat>': [...]}}
+    Profit is 销售毛利(扣费); lines whose weight cannot be resolved add profit and orders but no tons
+    and are counted in `missing`.
+    """
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.cells = {'week': {}, 'month': {}}
+        self.week_meta = {}
+        self.missing = 0
+
+    def add(self, row):
+        if not DATE_RE.match(row[0]):
+            return
+        kg = self.weights.kg(row[4], row[5], row[7])
+        if kg is None:
+            self.missing += 1
+        tons = row[8] * kg / 1000 if kg is not None else 0.0
+        week = self.week_meta.get(row[0])
+        if week is None:
+            week = self.week_meta[row[0]] = iso_week(row[0])
+        for grain, period in (('week', week[0]), ('month', row[0][:7])):
+            key = (period, row[7])
+            acc = self.cells[grain].get(key)
+            if acc is None:
+                acc = self.cells[grain][key] = [0.0, 0.0, set()]
+                if grain == 'week':
+                    acc.append(week)
+            acc[0] += tons
+            acc[1] += row[13]
+            if row[1]:
+                acc[2].add(row[1])
+
+    def result(self):
+        def measures(acc):
+            tons, profit = round(acc[0], 6), round(acc[1], 2)
+            return [tons, profit, round(profit / tons, 2) if tons else None, len(acc[2])]
+
+        weekly = [list(acc[3]) + [cat] + measures(acc) for (_, cat), acc in sorted(self.cells['week'].items())]
+        monthly = [[month, cat] + measures(acc) for (month, cat), acc in sorted(self.cells['month'].items())]
+        order_map = {
+            grain: {f'{period}||{cat}': sorted(acc[2]) for (period, cat), acc in sorted(cells.items())}
+            for grain, cells in self.cells.items()
+        }
+        return {'weekly': weekly, 'monthly': monthly}, order_map
+
+
+def load_old_rows():
     if not OLD.exists():
-        return {}, {}, {}, {}
+        return None
     with OLD.open('r', encoding='utf-8') as f:
         old = json.load(f)
     data = old.get('data', {})
-    return (
-        data.get('order_map', {}),
-        data.get('order_map_catton', {}),
-        data.get('cat_ton', {}),
-        data.get('cat_ton_meta', {"oil_density": 0.92, "fallback_bag_kg": 1, "missing_weight_lines": 0}),
-    )
+    rows = data.get('total', {}).get('rows')
+    if rows is not None and data.get('format') == 2:
+        rows = decode_rows(rows, data.get('dict', {}))
+    return rows
 
 
-def main():
-    if not SRC.exists():
-        raise SystemExit(f"Source file not found: {SRC}")
+def _latest_generated_at():
+    """generatedAt of OUT, read from the head of the file (SalesJsonWriter writes it first)."""
+    with OUT.open('r', encoding='utf-8') as f:
+        head = f.read(256)
+    m = re.match(r'\{"generatedAt":("(?:[^"\\]|\\.)*")', head)
+    return json.loads(m.group(1)) if m else None
 
-    order_map_old, order_map_catton, cat_ton, cat_ton_meta = load_old_meta()
 
-    wb = openpyxl.load_workbook(SRC, read_only=True, data_only=True)
-    ws = wb[wb.sheetnames[0]]
-    cols = list(next(ws.iter_rows(min_row=2, max_row=2, values_only=True)))
-    idx = {name: i for i, name in enumerate(cols)}
+class _JsonStream:
+    """Reads a JSON text front to back in chunks: fixed literals and one value at a time."""
 
-    segments = {
-        'total': [],
-        'store': [],
-        'nonstore': [],
-    }
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # Grows geometrically, so a large value (data.dict) is re-scanned only a few times.
+        chunk = self.f.read(max(1 << 16, len(self.buf) - self.pos))
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def expect(self, literal):
+        """Consume `literal` if the text continues with it."""
+        while len(self.buf) - self.pos < len(literal):
+            if not self._fill():
+                return False
+        if not self.buf.startswith(literal, self.pos):
+            return False
+        self.pos += len(literal)
+        return True
+
+    def value(self):
+        while True:
+            try:
+                val, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            # A number that ends the buffer may continue in the next chunk.
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return val
 
-    months = {
-        'total': set(),
-        'store': set(),
-        'nonstore': set(),
+
+def stream_latest_rows(before):
+    """Decoded total rows of OUT dated before `before`, read one row at a time, or None when OUT
+    does not have the layout SalesJsonWriter writes (generatedAt first; v2 with data.dict ahead
+    of the rows, as builds before that change did not)."""
+    f = OUT.open('r', encoding='utf-8')
+    js = _JsonStream(f)
+    dicts = None
+    try:
+        ok = js.expect('{"generatedAt":') and js.value() is not None and js.expect(',"data":{')
+        if ok and js.expect('"format":2,'):
+            ok = js.expect('"dict":')
+            dicts = js.value() if ok else None
+            ok = ok and js.expect(',')
+        ok = ok and js.expect('"total":{"rows":[')
+    except ValueError:
+        ok = False
+    if not ok:
+        f.close()
+        return None
+
+    def rows():
+        with f:
+            if js.expect(']'):
+                return
+            while True:
+                row = js.value()
+                if dicts is not None:
+                    row = decode_rows([row], dicts)[0]
+                # Rows are written in (单据日期, 单据编号) order.
+                if row[0] >= before:
+                    return
+                yield row
+                if not js.expect(','):
+                    return
+    return rows()
+
+
+def iter_old_rows(before):
+    """Rows of the previous build dated before `before`, or None when there is no previous build.
+
+    When the month shards were written by the same build as latest.json (same generatedAt) they
+    are read one month at a time, skipping months from `before` on; otherwise the rows stream
+    from latest.json. Only a latest.json written before data.dict moved ahead of the rows is
+    loaded whole.
+    """
+    if not OLD.exists():
+        return None
+    manifest = None
+    if SHARD_MANIFEST.exists():
+        try:
+            manifest = json.loads(SHARD_MANIFEST.read_text(encoding='utf-8'))
+        except ValueError:
+            manifest = None
+    if manifest and manifest.get('generatedAt') == _latest_generated_at() and \
+            all((SHARD_DIR / e['file']).exists() for e in manifest.get('months', [])):
+        def shard_rows():
+            for e in manifest['months']:
+                if e['month'] > before[:7]:
+                    break
+                with (SHARD_DIR / e['file']).open('r', encoding='utf-8') as f:
+                    shard = json.load(f)
+                rows = shard['total']['rows']
+                if shard.get('format') == 2:
+                    rows = decode_rows(rows, shard['dict'])
+                for row in rows:
+                    if row[0] < before:
+                        yield row
+        return shard_rows()
+    rows = stream_latest_rows(before)
+    if rows is not None:
+        return rows
+    rows = load_old_rows()
+    if rows is None:
+        return None
+    return (row for row in rows if row[0] < before)
+
+
+def parse_row(r, idx):
+    dt = to_date_str(r[idx['单据日期']])
+    if not dt:
+        return None
+    order_no = norm_text(r[idx['单据编号']])
+    cust = norm_text(r[idx['客户名称']])
+    cls = norm_text(r[idx['客户分类']])
+    name = norm_text(r[idx['商品名称']])
+    spec = norm_text(r[idx['规格型号']])
+    qty = to_float(r[idx['数量']])
+    sales = to_float(r[idx['价税合计']])
+    cost = to_float(r[idx['成本']])
+    fee = to_float(r[idx.get('关联销售费用')])
+    gp = to_float(r[idx.get('销售毛利')])
+    if gp == 0 and (sales or cost):
+        gp = sales - cost
+    gp_adj = gp - fee
+    unit_price = to_float(r[idx.get('实际含税单价')])
+    cat = category_of(name, spec)
+    prod_label = product_label(name, spec)
+
+    return [
+        dt, order_no, cust, cls, name, spec, prod_label, cat,
+        qty, sales, cost, fee, gp, gp_adj, unit_price
+    ]
+
+
+def add_row(segments, months, row):
+    month = row[0][:7]
+    segments['total'].append(row)
+    months['total'].add(month)
+    if row[3] == '超群门店':
+        segments['store'].append(row)
+        months['store'].add(month)
+    else:
+        segments['nonstore'].append(row)
+        months['nonstore'].add(month)
+
+
+def build_shard(month, rows, fmt):
+    """Self-contained payload for one month, shaped like latest.json's `data`."""
+    segments = {key: [] for key in SEGMENTS}
+    months = {key: set() for key in SEGMENTS}
+    for row in rows:
+        add_row(segments, months, row)
+    payload = build_segments_payload(segments, months, fmt)
+    for key in SEGMENTS:
+        cubes = build_rollups(segments[key])
+        payload[key].update({cube: cubes[cube] for cube in SHARD_CUBES})
+        payload[key]['order_index'] = build_order_index(segments[key])
+        payload[key]['count'] = len(segments[key])
+    payload['month'] = month
+    return payload
+
+
+def write_shards(shards, payload, generated_at):
+    """Write data/sales/<YYYY-MM>.json plus manifest.json; unchanged shards are left untouched.
+
+    `shards` yields (month, shard) pairs; `payload` holds the per-segment months, monthly and
+    daily_cum plus the meta keys. Shard bodies carry no timestamp, so their sha256 only changes
+    with their rows and the dashboard can cache them by hash.
+    """
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    entries = []
+    written = 0
+    for month, shard in shards:
+        body = json.dumps(shard, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        path = SHARD_DIR / f'{month}.json'
+        if not path.exists() or path.read_bytes() != body:
+            path.write_bytes(body)
+            written += 1
+        entries.append({
+            'month': month,
+            'file': path.name,
+            'rows': shard['total']['count'],
+            'segments': {key: shard[key]['count'] for key in SEGMENTS},
+            'bytes': len(body),
+            'sha256': hashlib.sha256(body).hexdigest(),
+        })
+    kept = {e['month'] for e in entries}
+    for path in SHARD_DIR.iterdir():
+        if SHARD_NAME_RE.match(path.name) and path.stem not in kept:
+            path.unlink()
+
+    segments = {}
+    for key in SEGMENTS:
+        seg = payload[key]
+        cum = seg['daily_cum']
+        last = date.fromisoformat(cum['start']) + timedelta(days=cum['days'] - 1) if cum['days'] else None
+        segments[key] = {
+            'months': seg['months'],
+            'monthly': seg['monthly'],
+            'daily_cum': cum,
+            'min_date': cum['start'],
+            'max_date': last.isoformat() if last else None,
+        }
+    manifest = {
+        'format': 'sales-shards',
+        'version': SHARD_VERSION,
+        'generatedAt': generated_at,
+        'row_format': 2 if payload.get('format') == 2 else 1,
+        'months': entries,
+        'segments': segments,
+        'min_date': segments['total']['min_date'],
+        'max_date': segments['total']['max_date'],
     }
+    for key in ('category_meta', 'order_map_catton', 'cat_ton', 'cat_ton_meta'):
+        manifest[key] = payload.get(key)
+    SHARD_MANIFEST.write_text(json.dumps(manifest, ensure_ascii=False, separators=(',', ':')), encoding='utf-8')
+    return written
+
+
+class MonthRowSpool:
+    """Rows spooled to per-month row files under `tmpdir`, replayed in (单据日期, 单据编号) order.
+
+    Months are replayed in order and each month is sorted on its own, so only one month of rows
+    is in memory at a time. The sort is stable within a month, which gives the same sequence as a
+    stable sort of every row in the order they were added.
+    """
+
+    def __init__(self, tmpdir):
+        self.dir = Path(tmpdir)
+        self.files = {}
+        self.pending = {}
+        self.count = 0
+
+    def add(self, row):
+        month = row[0][:7]
+        chunk = self.pending.get(month)
+        if chunk is None:
+            chunk = self.pending[month] = []
+            self.files[month] = (self.dir / f'rows-{month}.rows').open('wb')
+        chunk.append(row)
+        if len(chunk) >= ROW_CHUNK:
+            pickle.dump(chunk, self.files[month], protocol=pickle.HIGHEST_PROTOCOL)
+            self.pending[month] = []
+        self.count += 1
+
+    def __iter__(self):
+        for month in sorted(self.files):
+            f = self.files[month]
+            if self.pending[month]:
+                pickle.dump(self.pending[month], f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.pending[month] = None
+            f.close()
+            rows = list(read_row_file(f.name))
+            os.unlink(f.name)
+            rows.sort(key=lambda r: (r[0], r[1]))
+            yield from rows
+
 
-    for r in ws.iter_rows(min_row=3, values_only=True):
-        if not r or r[0] is None:
-            continue
-        dt = to_date_str(r[idx['单据日期']])
-        if not dt:
-            continue
-        month = dt[:7]
-        order_no = norm_text(r[idx['单据编号']])
-        cust = norm_text(r[idx['客户名称']])
-        cls = norm_text(r[idx['客户分类']])
-        name = norm_text(r[idx['商品名称']])
-        spec = norm_text(r[idx['规格型号']])
-        qty = to_float(r[idx['数量']])
-        sales = to_float(r[idx['价税合计']])
-        cost = to_float(r[idx['成本']])
-        fee = to_float(r[idx.get('关联销售费用')])
-        gp = to_float(r[idx.get('销售毛利')])
-        if gp == 0 and (sales or cost):
-            gp = sales - cost
-        gp_adj = gp - fee
-        unit_price = to_float(r[idx.get('实际含税单价')])
-        cat = category_of(name, spec)
-        prod_label = product_label(name, spec)
-
-        row = [
-            dt, order_no, cust, cls, name, spec, prod_label, cat,
-            qty, sales, cost, fee, gp, gp_adj, unit_price
-        ]
-
-        segments['total'].append(row)
-        months['total'].add(month)
-        if cls == '超群门店':
-            segments['store'].append(row)
-            months['store'].add(month)
+class SalesJsonWriter:
+    """Streams rows into latest.json without holding the segment row lists in memory.
+
+    Rows are serialized one at a time into per-segment temp spools (v2: encoded total rows plus
+    store/nonstore row indexes; v1: full rows per segment) while months, rollups, daily sums and
+    dictionary codes accumulate alongside. finish() stitches spools and metadata into a temp file
+    next to OUT and renames it into place, so readers never see a half-written file. With
+    `shards`, rows are also spooled per month so each shard is built from one month of rows.
+    """
+
+    def __init__(self, out, fmt, shards=False, weights=None):
+        self.out = Path(out)
+        self.fmt = fmt
+        self.out.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = tempfile.TemporaryDirectory(dir=self.out.parent, prefix='.build-')
+        self.tmpdir = Path(self._tmp.name)
+        spool_keys = ['total', 'store', 'nonstore']
+        self.spools = {key: (self.tmpdir / f'{key}.spool').open('w', encoding='utf-8') for key in spool_keys}
+        self.counts = {key: 0 for key in SEGMENTS}
+        self.months = {key: set() for key in SEGMENTS}
+        self.rollups = {key: Rollups() for key in SEGMENTS}
+        self.daily = {key: DailyTotals() for key in SEGMENTS}
+        self.orders = {key: OrderIndex() for key in SEGMENTS}
+        self.weights = weights or SpecWeights()
+        self.tonnage = {key: CatTonnage(self.weights) for key in SEGMENTS}
+        self.codes = {key: {} for key, _ in DICT_FIELDS}
+        self.cat_hits = {}
+        self.products = set()
+        self.month_spools = {} if shards else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for f in self.spools.values():
+            f.close()
+        if self.month_spools:
+            for f in self.month_spools.values():
+                f.close()
+        self._tmp.cleanup()
+
+    def _emit(self, key, text):
+        self.spools[key].write(f',{text}' if self.counts[key] else text)
+
+    def add(self, row):
+        month = row[0][:7]
+        seg = 'store' if row[3] == '超群门店' else 'nonstore'
+        for key in ('total', seg):
+            self.months[key].add(month)
+            self.rollups[key].add(row)
+            self.daily[key].add(row)
+            self.orders[key].add(row)
+            self.tonnage[key].add(row)
+        self.cat_hits[row[7]] = self.cat_hits.get(row[7], 0) + 1
+        self.products.add((row[4], row[5]))
+        if self.fmt == 'v1':
+            text = json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+            self._emit('total', text)
+            self._emit(seg, text)
         else:
-            segments['nonstore'].append(row)
-            months['nonstore'].add(month)
-
-    data = {
-        'generatedAt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'data': {
-            'total': {'rows': segments['total'], 'months': sorted(months['total'])},
-            'store': {'rows': segments['store'], 'months': sorted(months['store'])},
-            'nonstore': {'rows': segments['nonstore'], 'months': sorted(months['nonstore'])},
+            enc = list(row)
+            for key, pos in DICT_FIELDS:
+                table = self.codes[key]
+                code = table.get(row[pos])
+                if code is None:
+                    code = table[row[pos]] = len(table)
+                enc[pos] = code
+            self._emit('total', json.dumps(enc, ensure_ascii=False, separators=(',', ':')))
+            self._emit(seg, str(self.counts['total']))
+        self.counts['total'] += 1
+        self.counts[seg] += 1
+        if self.month_spools is not None:
+            f = self.month_spools.get(month)
+            if f is None:
+                f = self.month_spools[month] = (self.tmpdir / f'month-{month}.jsonl').open('w', encoding='utf-8')
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def segment_meta(self, key):
+        meta = {'months': sorted(self.months[key])}
+        meta.update(self.rollups[key].result())
+        meta['daily_cum'] = self.daily[key].result()
+        meta['order_index'] = self.orders[key].result()
+        return meta
+
+    def category_meta(self):
+        return get_categorizer().report(self.cat_hits, len(self.products))
+
+    def cat_ton(self):
+        """(cat_ton, order_map_catton, cat_ton_meta) for the whole build."""
+        cat_ton, order_map = {}, {}
+        for key in SEGMENTS:
+            cat_ton[key], order_map[key] = self.tonnage[key].result()
+        meta = {
+            'oil_density': self.weights.oil_density,
+            'fallback_bag_kg': self.weights.fallback_bag_kg,
+            'missing_weight_lines': self.tonnage['total'].missing,
+            'distinct_specs': len(self.weights._memo),
+        }
+        return cat_ton, order_map, meta
+
+    def iter_shards(self):
+        for month in sorted(self.month_spools or {}):
+            f = self.month_spools[month]
+            f.close()
+            with (self.tmpdir / f'month-{month}.jsonl').open('r', encoding='utf-8') as rf:
+                rows = [json.loads(line) for line in rf]
+            yield month, build_shard(month, rows, self.fmt)
+
+    def finish(self, extra, generated_at):
+        """Write OUT atomically; returns the summary payload (everything except the rows)."""
+        dump = lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+        summary = {'format': 2} if self.fmt == 'v2' else {}
+        rows_key = {key: 'rows' for key in SEGMENTS}
+        if self.fmt == 'v2':
+            rows_key.update(store='row_idx', nonstore='row_idx')
+        tmp_out = self.out.with_name(self.out.name + '.tmp')
+        with tmp_out.open('w', encoding='utf-8') as out:
+            out.write('{"generatedAt":' + dump(generated_at) + ',"data":{')
+            if self.fmt == 'v2':
+                # The dict goes ahead of the rows so stream_latest_rows() can decode them in one pass.
+                out.write('"format":2,"dict":' + dump({key: list(table) for key, table in self.codes.items()}) + ',')
+            for key in SEGMENTS:
+                spool = self.spools[key]
+                spool.close()
+                out.write(dump(key) + ':{' + dump(rows_key[key]) + ':[')
+                with open(spool.name, 'r', encoding='utf-8') as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+                meta = self.segment_meta(key)
+                summary[key] = meta
+                out.write('],' + dump(meta)[1:] + ',')
+            out.write(dump(extra)[1:] + '}')
+        os.replace(tmp_out, self.out)
+        summary.update(extra)
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build data/latest.json from the 销售利润表 export.')
+    parser.add_argument('--src', default=str(SRC), help='销售利润表.xlsx，或包含多份导出的目录 / glob（按文件名排序合并去重）')
+    parser.add_argument('--workers', type=int, default=0, help='并行解析的进程数（0 = CPU 核数，单文件时不启用进程池）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='只重新解析水位线单据日期（含当天）之后的行，与现有 latest.json 中更早的行合并；'
+                             'latest.json 仍整体重写，分片只重写内容变化的月份。--format/--shards/--oil-density/'
+                             '--fallback-bag-kg 或品类规则与上次不同时自动全量重建。旧行按月从分片或逐行从 latest.json 流式读回'
+                             '（dict 前置之前生成的 latest.json 会整体载入一次）')
+    parser.add_argument('--lookback-days', type=int, default=0,
+                        help='配合 --incremental：从水位线日期往前多重新解析几天，用于吸收对近期旧单据的修改；'
+                             '更早日期的修改需要不带 --incremental 全量重建')
+    parser.add_argument('--format', choices=['v1', 'v2'], default='v2',
+                        help='v2：字典编码行 + store/nonstore 以 total 行号表示（默认）；v1：旧版整行格式')
+    parser.add_argument('--category-rules', default=str(CATEGORY_RULES), help='品类关键词规则文件（JSON，含 version）')
+    parser.add_argument('--reader', choices=['auto', 'stream', 'openpyxl'], default='auto',
+                        help='xlsx 读取后端：auto 先用流式解析，遇到不支持的结构回退 openpyxl')
+    parser.add_argument('--bench-readers', action='store_true', help='对比 openpyxl 与流式读取后端的耗时后退出')
+    parser.add_argument('--shards', action='store_true',
+                        help='同时输出按月分片 data/sales/<YYYY-MM>.json 与 manifest.json，供看板按日期范围懒加载')
+    parser.add_argument('--oil-density', type=float, default=OIL_DENSITY, help='食用油折吨密度（千克/升）')
+    parser.add_argument('--fallback-bag-kg', type=float, default=FALLBACK_BAG_KG,
+                        help='袋装且规格/品名无重量时按每袋多少千克折吨')
+    parser.add_argument('--no-cache', action='store_true', help='不读写解析缓存，强制重新解析 Excel')
+    parser.add_argument('--cache-dir', default=str(parse_cache.DEFAULT_DIR), help='解析缓存目录（按文件 sha256 + 读取参数索引）')
+    args = parser.parse_args(argv)
+    parse_cache.configure(enabled=not args.no_cache, cache_dir=args.cache_dir)
+
+    global _CATEGORIZER
+    _CATEGORIZER = Categorizer.from_file(args.category_rules)
+
+    paths = resolve_sources(args.src)
+    if not paths:
+        raise SystemExit(f"Source file not found: {args.src}")
+    if args.bench_readers:
+        bench_readers(paths[0])
+        return
+
+    source = sources_fingerprint(paths)
+    settings = build_settings(args)
+    state = load_state() if args.incremental else None
+    if state and state.get('settings') != settings:
+        print('Build settings or category rules changed since the last build, doing a full rebuild')
+        state = None
+    if state and state.get('source', {}).get('sha256') == source['sha256'] and OUT.exists():
+        print(f"Source unchanged ({source['sha256'][:12]}), {OUT} is up to date")
+        return
+
+    since = incremental_since(state, args.lookback_days)
+    old_rows = iter_old_rows(since) if since else None
+    parse_state = {'columns': state.get('columns'), 'since': since} if old_rows is not None else None
+
+    weights = SpecWeights(oil_density=args.oil_density, fallback_bag_kg=args.fallback_bag_kg)
+    with SalesJsonWriter(OUT, args.format, shards=args.shards, weights=weights) as writer:
+        # Each export is parsed into a row file; rows then go to disk per month and come back sorted
+        # one month at a time, so every (单据日期, 单据编号) is one contiguous run for the order index
+        # and no stage holds all rows in memory.
+        parsed = parse_sources(paths, args.reader, parse_state, args.workers, args.category_rules, writer.tmpdir)
+        if len({s for _, _, s in parsed}) > 1:
+            # Exports disagree on the header layout: the watermark cannot be trusted for all of them.
+            parsed = parse_sources(paths, args.reader, None, args.workers, args.category_rules, writer.tmpdir)
+        col_names, _, since = parsed[0]
+
+        spool = MonthRowSpool(writer.tmpdir)
+        if since is not None:
+            # Everything from `since` on was re-parsed above; keep only the older lines.
+            for row in old_rows:
+                spool.add(row)
+        if args.incremental and since is None:
+            print('No usable watermark, falling back to a full rebuild')
+        old_rows = None
+        base_count = spool.count
+        _, dropped = merge_sources([read_row_file(out) for _, out, _ in parsed], spool.add)
+        for _, out, _ in parsed:
+            out.unlink()
+        if len(paths) > 1:
+            print(f"Merged {len(paths)} exports, dropped {dropped} duplicate lines")
+        generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        last_key = ('', '')
+        if since is not None:
+            wm = state['watermark']
+            last_key = (wm.get('date') or '', wm.get('order_no') or '')
+        row = None
+        for row in spool:
+            writer.add(row)
+        if row is not None:
+            last_key = max(last_key, (row[0], row[1]))
+
+        cat_ton, order_map_catton, cat_ton_meta = writer.cat_ton()
+        summary = writer.finish({
+            'category_meta': writer.category_meta(),
             'order_map': {},
             'order_map_catton': order_map_catton,
             'cat_ton': cat_ton,
             'cat_ton_meta': cat_ton_meta,
-        }
-    }
+        }, generated_at)
+        if args.shards:
+            written = write_shards(writer.iter_shards(), summary, generated_at)
+            print(f"Wrote {SHARD_MANIFEST} with {len(writer.month_spools)} month shards ({written} changed)")
+        total = writer.counts['total']
 
-    OUT.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
-    print(f"Wrote {OUT} with {len(segments['total'])} rows")
+    save_state(source, settings, col_names, {'date': last_key[0], 'order_no': last_key[1]}, total)
+    if since is not None:
+        print(f"Wrote {OUT} with {total} rows ({total - base_count} parsed from {since})")
+    else:
+        print(f"Wrote {OUT} with {total} rows")
+    report = summary['category_meta']
+    hits = ', '.join(f"{k}={v}" for k, v in report['hits'].items())
+    print(f"Category rules v{report['rules_version']}: {report['distinct_products']} distinct products; hits {hits}")
+    print(f"Tonnage: {cat_ton_meta['distinct_specs']} distinct specs, {cat_ton_meta['missing_weight_lines']} lines without weight")
 
 
 if __name__ == '__main__':
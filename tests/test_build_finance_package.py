@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'tools'))
+import build_finance_package as fin  # noqa: E402
+
+
+def inventory_frame(n=40):
+    # One SKU, many same-day rows: the ending balance of the day is the last row in sheet order.
+    rows = [{'日期': '2025-03-10', 'SKU': 'A', '入库成本': 1.0, '出库成本': 0.0, '期末库存成本': float(i)}
+            for i in range(n)]
+    rows += [{'日期': '2025-04-02', 'SKU': 'A', '入库成本': 1.0, '出库成本': 0.0, '期末库存成本': 1000.0 + i}
+             for i in range(n)]
+    return pd.DataFrame(rows)
+
+
+def test_inventory_ending_takes_last_same_day_row_in_sheet_order():
+    inv = fin.build_inventory(inventory_frame(), '2025-03-01', '2025-04-30')
+    assert inv['trend']['months'] == ['2025-03', '2025-04']
+    assert inv['trend']['ending_inventory'] == [39.0, 1039.0]
+
+
+def test_inventory_ending_of_a_month_does_not_depend_on_other_months():
+    df = inventory_frame()
+    full = fin.build_inventory(df, '2025-03-01', '2025-04-30')['trend']['ending_inventory']
+    march = fin.build_inventory(df[df['日期'] < '2025-04-01'].copy(), '2025-03-01', '2025-03-31')
+    assert march['trend']['ending_inventory'] == full[:1]
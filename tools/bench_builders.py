@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Stage timings for build_daily_json.py and build_finance_package.py on synthetic exports.
+
+Each stage reports wall time, rows/s and memory: the process peak RSS after the stage and,
+with --trace-memory, the Python-level allocation peak inside the stage (tracemalloc; slows
+the run, so timings from such a run are not comparable). Results go to a JSON file; with
+--baseline the run fails when a stage is slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import build_finance_package as fin
+import gen_synthetic_exports as gen
+import parse_cache
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'scripts'))
+import build_daily_json as daily  # noqa: E402
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class StageTimer:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        """Time the block; it may set ['rows'] on the yielded dict when the count is known only after."""
+        box = {'rows': rows}
+        if self.trace_memory:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        yield box
+        seconds = time.perf_counter() - t0
+        rows = box['rows']
+        entry = {
+            'stage': name,
+            'rows': rows,
+            'seconds': round(seconds, 4),
+            'rows_per_s': round(rows / seconds) if seconds > 0 else None,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        if self.trace_memory:
+            entry['py_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            tracemalloc.stop()
+        self.stages.append(entry)
+        print(f"{name:<22} {rows:>9} rows {seconds:>9.3f}s {entry['rows_per_s'] or 0:>10} rows/s "
+              f"rss {entry['peak_rss_mb']:>8} MB" + (f" py {entry['py_peak_mb']} MB" if self.trace_memory else ''))
+
+
+def bench_daily(timer, src, workdir):
+    """Read, parse and write latest.json the way build_daily_json.main() does, stage by stage."""
+    with timer.stage('daily.read') as st:
+        cols, raw = daily.read_raw_auto(str(src))
+        st['rows'] = len(raw)
+    with timer.stage('daily.parse', len(raw)):
+        _, rows, _ = daily.read_source(cols, raw, None)
+    raw = None
+    with timer.stage('daily.write', len(rows)):
+        rows.sort(key=lambda r: (r[0], r[1]))
+        with daily.SalesJsonWriter(Path(workdir) / 'latest.json', 'v2') as writer:
+            for row in rows:
+                writer.add(row)
+            cat_ton, order_map_catton, cat_ton_meta = writer.cat_ton()
+            writer.finish({'category_meta': writer.category_meta(), 'order_map': {},
+                           'order_map_catton': order_map_catton, 'cat_ton': cat_ton,
+                           'cat_ton_meta': cat_ton_meta}, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def bench_finance(timer, files, period_start, period_end, workdir, workers=1):
+    paths = {kind: str(files[kind]) for kind in fin.WORKBOOK_READERS}
+    if workers > 1:
+        with timer.stage('finance.read.parallel') as st:
+            frames = fin.load_workbooks(paths, workers)
+            st['rows'] = sum(len(df) for df in frames.values())
+    else:
+        frames = {}
+        for kind, path in paths.items():
+            with timer.stage(f'finance.read.{kind}') as st:
+                frames[kind] = fin.read_workbook(kind, path)
+                st['rows'] = len(frames[kind])
+
+    df_bank = frames['bank']
+    with timer.stage('finance.bank_txns', len(df_bank)):
+        txns = fin.build_bank_txns(df_bank, period_start, period_end)
+    bank = fin.build_bank(df_bank, period_start, period_end)
+    with timer.stage('finance.risk', len(txns)):
+        risk = fin.build_risk_and_anomalies(bank, txns)
+    with timer.stage('finance.quantiles', len(txns)):
+        bank['quantiles'], _ = fin.build_txn_quantiles(fin.txn_table(txns))
+    with timer.stage('finance.po', len(frames['po'])):
+        po = fin.build_po(frames['po'], period_start, period_end)
+    bank['txns'] = txns
+    bank['risk'] = risk
+    with timer.stage('finance.dump', len(txns)):
+        fin.dump_json(os.path.join(workdir, 'finance_latest.json'), {'bank': bank, 'po': po})
+
+
+def compare(stages, baseline_path, tolerance):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {s['stage']: s for s in json.load(f).get('stages', [])}
+    regressions = []
+    for s in stages:
+        base = baseline.get(s['stage'])
+        if not base or not base.get('seconds'):
+            continue
+        ratio = s['seconds'] / base['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append((s['stage'], base['seconds'], s['seconds'], ratio))
+    for name, old, new, ratio in regressions:
+        print(f"REGRESSION {name}: {old:.3f}s -> {new:.3f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sales and finance builders on synthetic exports.')
+    parser.add_argument('--scale', default='10k', help='销售利润表行数：10k / 100k / 1m 或具体数字')
+    parser.add_argument('--data-dir', help='合成数据目录（缺失的表会先生成）；默认 .cache/bench/<scale>')
+    parser.add_argument('--months', type=int, default=12, help='合成数据覆盖月数')
+    parser.add_argument('--seed', type=int, default=7, help='合成数据随机种子')
+    parser.add_argument('--only', choices=['daily', 'finance'], help='只跑一个构建脚本')
+    parser.add_argument('--workers', type=int, default=1, help='finance 读表进程数（>1 时记录一个 finance.read.parallel 阶段）')
+    parser.add_argument('--trace-memory', action='store_true', help='用 tracemalloc 记录每个阶段的 Python 内存峰值（较慢）')
+    parser.add_argument('--out', help='结果 JSON 路径；默认 <data-dir>/bench_results.json')
+    parser.add_argument('--baseline', help='对比的基线结果 JSON；任一阶段变慢超过 --tolerance 时返回非零')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的变慢比例（默认 0.2 = 20%%）')
+    args = parser.parse_args()
+
+    rows = gen.parse_rows(args.scale)
+    data_dir = Path(args.data_dir or Path('.cache/bench') / str(args.scale).lower())
+    files = {kind: data_dir / name for kind, name in gen.FILES.items()}
+    missing = [kind for kind, path in files.items() if not path.exists()]
+    if missing:
+        print(f"Generating {', '.join(missing)} into {data_dir} ({rows} sales lines)")
+        gen.generate(data_dir, rows, months=args.months, seed=args.seed, only=missing)
+    period_start, period_end = gen.period_of(months=args.months)
+    # Every run measures the real parse, not a parse-cache hit.
+    parse_cache.configure(enabled=False)
+
+    timer = StageTimer(trace_memory=args.trace_memory)
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        if args.only in (None, 'daily'):
+            bench_daily(timer, files['sales'], workdir)
+        if args.only in (None, 'finance'):
+            bench_finance(timer, files, period_start, period_end, workdir, args.workers)
+
+    result = {
+        'scale': args.scale,
+        'rows': rows,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'trace_memory': args.trace_memory,
+        'workers': args.workers,
+        'stages': timer.stages,
+    }
+    out = Path(args.out or data_dir / 'bench_results.json')
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open('w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    print(f"Wrote {out}")
+
+    if args.baseline and compare(timer.stages, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
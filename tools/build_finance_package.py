@@ -1,15 +1,28 @@
 #!/usr/bin/env python3
 import argparse
+import cProfile
 import json
 import math
 import os
+import pickle
+import pstats
 import re
+import resource
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, date
 from glob import glob
 
+import numpy as np
 import pandas as pd
 
+import parse_cache
+import quantile_sketch
+from keyword_rules import KeywordRules
+from quantile_sketch import QuantileSketch
+
 
 TOP_N = 20
 RISK_THRESHOLDS = {
@@ -21,6 +34,7 @@ RISK_THRESHOLDS = {
     'financing_net_ratio': (0.30, 0.60)
 }
 ANOMALY_KEYWORDS = ['借', '贷', '押金', '保证金', '承兑', '理财', '代付', '代收', '私']
+CF_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cf_rules.json')
 
 
 def normalize_text(val):
@@ -76,42 +90,210 @@ def merge_headers(header_df):
     return make_unique(cols)
 
 
-def read_excel_with_header(path, sheet_name=0, header_row=0, header_rows=1):
-    df_raw = pd.read_excel(path, sheet_name=sheet_name, header=None, dtype=object)
+# Part of the parse-cache key; bump when the frames the readers return change (columns, attrs).
+READER_VERSION = 2
+
+def _read_raw(path, sheet_name=0):
+    return pd.read_excel(path, sheet_name=sheet_name, header=None, dtype=object)
+
+
+def _frame_with_header(df_raw, header_row=0, header_rows=1):
     header_df = df_raw.iloc[header_row:header_row + header_rows]
     data_df = df_raw.iloc[header_row + header_rows:]
     data_df = data_df.dropna(how='all')
     data_df.columns = merge_headers(header_df)
-    return data_df.reset_index(drop=True)
+    frame = data_df.reset_index(drop=True)
+    # Rows of the sheet as read (titles, headers and blank rows included), the rows_in of the
+    # --profile read stages; attrs are pickled with the frame, so cache hits and workers keep it.
+    frame.attrs['sheet_rows'] = len(df_raw)
+    return frame
+
+
+def _read_excel_with_header(path, sheet_name=0, header_row=0, header_rows=1):
+    return _frame_with_header(_read_raw(path, sheet_name), header_row=header_row, header_rows=header_rows)
+
+
+def read_excel_with_header(path, sheet_name=0, header_row=0, header_rows=1):
+    params = {'reader': 'with_header', 'v': READER_VERSION, 'sheet': sheet_name,
+              'header_row': header_row, 'header_rows': header_rows}
+    return parse_cache.cached(path, params, lambda: _read_excel_with_header(
+        path, sheet_name=sheet_name, header_row=header_row, header_rows=header_rows))
 
 
 def read_excel_guess_header(path, sheet_name=0, max_header=3):
-    df_raw = pd.read_excel(path, sheet_name=sheet_name, header=None, dtype=object)
+    params = {'reader': 'guess_header', 'v': READER_VERSION, 'sheet': sheet_name, 'max_header': max_header}
+    return parse_cache.cached(path, params, lambda: _read_excel_guess_header(
+        path, sheet_name=sheet_name, max_header=max_header))
+
+
+def guess_header_row(df_head, max_header=3):
+    """Index of the candidate row (0..max_header) with the most non-empty header names."""
     best = None
-    for header_row in range(max_header + 1):
-        header_df = df_raw.iloc[header_row:header_row + 1]
-        cols = merge_headers(header_df)
+    for header_row in range(min(max_header + 1, len(df_head))):
+        cols = merge_headers(df_head.iloc[header_row:header_row + 1])
         if not cols:
             continue
         non_empty = sum(1 for c in cols if c and not str(c).lower().startswith('unnamed'))
         if best is None or non_empty > best[0]:
-            best = (non_empty, header_row, cols)
-    if best is None:
-        return read_excel_with_header(path, sheet_name=sheet_name, header_row=0, header_rows=1)
-    return read_excel_with_header(path, sheet_name=sheet_name, header_row=best[1], header_rows=1)
+            best = (non_empty, header_row)
+    return best[1] if best else 0
+
+
+def _read_excel_guess_header(path, sheet_name=0, max_header=3):
+    # One decode of the sheet: the header is scored on its first rows, the body is sliced from the same frame.
+    df_raw = _read_raw(path, sheet_name)
+    header_row = guess_header_row(df_raw.iloc[:max_header + 1], max_header=max_header)
+    return _frame_with_header(df_raw, header_row=header_row, header_rows=1)
+
+
+# How main() reads each input workbook: (reader, header kwargs).
+WORKBOOK_READERS = {
+    'sales': ('guess_header', {}),
+    'ar': ('with_header', {'header_row': 1, 'header_rows': 2}),
+    'ap': ('with_header', {'header_row': 1, 'header_rows': 2}),
+    'bank': ('with_header', {'header_row': 2, 'header_rows': 1}),
+    'inv': ('with_header', {'header_row': 1, 'header_rows': 2}),
+    'po': ('with_header', {'header_row': 2, 'header_rows': 1}),
+}
+
+
+def read_workbook(kind, path):
+    reader, kwargs = WORKBOOK_READERS[kind]
+    if reader == 'guess_header':
+        return read_excel_guess_header(path, **kwargs)
+    return read_excel_with_header(path, **kwargs)
+
+
+def _init_worker(cache_enabled, cache_dir):
+    parse_cache.configure(enabled=cache_enabled, cache_dir=cache_dir)
+
+
+def _load_workbook(task):
+    kind, path = task
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    df = read_workbook(kind, path)
+    timing = {'wall_s': round(time.perf_counter() - wall0, 4), 'cpu_s': round(time.process_time() - cpu0, 4)}
+    # Pickled once here at the highest protocol; the pool then only ships the bytes back.
+    return kind, pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), timing
+
+
+def load_workbooks(paths, workers=0):
+    """Read {kind: path} into {kind: DataFrame}, in a process pool when workers > 1."""
+    workers = min(len(paths), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        frames = {}
+        for kind, path in paths.items():
+            with profile_stage(f'read_{kind}') as st:
+                frames[kind] = read_workbook(kind, path)
+                st['rows_in'] = frames[kind].attrs.get('sheet_rows')
+                st['rows_out'] = len(frames[kind])
+        return frames
+
+    # Largest workbooks first, so the slowest one starts right away and bounds the wall time.
+    tasks = sorted(paths.items(), key=lambda kv: os.path.getsize(kv[1]), reverse=True)
+    cfg = parse_cache._config
+    frames = {}
+    with profile_stage('read_parallel') as st:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(cfg['enabled'], str(cfg['dir']))) as pool:
+            timings = {}
+            for kind, payload, timing in pool.map(_load_workbook, tasks):
+                frames[kind] = pickle.loads(payload)
+                timings[kind] = dict(timing, rows_in=frames[kind].attrs.get('sheet_rows'), rows=len(frames[kind]))
+        st['rows_in'] = sum(t['rows_in'] or 0 for t in timings.values())
+        st['rows_out'] = sum(len(df) for df in frames.values())
+        st['workers'] = workers
+        st['files'] = timings
+    return {kind: frames[kind] for kind in paths}
 
 
 def find_column(df, patterns):
-    cols = list(df.columns)
-    norm_map = {col: normalize_col_key(col) for col in cols}
-    for pat in patterns:
-        keys = pat if isinstance(pat, (list, tuple)) else [pat]
-        keys = [normalize_col_key(k) for k in keys]
-        for col in cols:
-            ncol = norm_map[col]
-            if all(k in ncol for k in keys):
-                return col
-    return None
+    return schema_for(df).find(patterns)
+
+
+# Logical fields of 企业收支明细表, resolved once per frame through FrameSchema.field().
+BANK_FIELDS = {
+    'date': [['日期'], ['记账日期'], ['业务日期']],
+    'income': [['收入', '本位币'], ['收入金额'], ['收款']],
+    'outflow': [['支出', '本位币'], ['支出金额'], ['付款']],
+    'type': [['类型'], ['业务类型'], ['单据类型']],
+    'counterparty': [['对方单位'], ['对方名称'], ['往来单位'], ['对方']],
+    'memo': [['摘要'], ['用途'], ['备注'], ['说明']],
+    'match': [['对账状态'], ['匹配状态'], ['核对状态'], ['勾稽状态']],
+}
+
+
+class FrameSchema:
+    """Column resolution and parsed Series for one input frame, shared by every builder.
+
+    Headers are normalized once; each find() pattern list is resolved once. dates() and
+    numbers() cache the pd.to_datetime / pd.to_numeric conversion of a column, so the bank
+    sheet is converted once per run however many builders read it. Cached Series assume the
+    column's values are not edited in place afterwards (build_po forward-fills df_po before
+    anything asks for its Series); adding or renaming columns resets the cache.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._reset()
+
+    def _reset(self):
+        self._index = self.df.columns
+        self._norm = [(col, normalize_col_key(col)) for col in self._index]
+        self._found = {}
+        self._dates = {}
+        self._numbers = {}
+
+    def _check(self):
+        if self.df.columns is not self._index:
+            self._reset()
+
+    def find(self, patterns):
+        self._check()
+        key = tuple(tuple(p) if isinstance(p, (list, tuple)) else (p,) for p in patterns)
+        if key in self._found:
+            return self._found[key]
+        found = None
+        for pat in key:
+            keys = [normalize_col_key(k) for k in pat]
+            found = next((col for col, ncol in self._norm if all(k in ncol for k in keys)), None)
+            if found is not None:
+                break
+        self._found[key] = found
+        return found
+
+    def field(self, name):
+        return self.find(BANK_FIELDS[name])
+
+    def dates(self, col):
+        self._check()
+        if col not in self._dates:
+            self._dates[col] = parse_date_series(self.df[col])
+        return self._dates[col]
+
+    def numbers(self, col, fill=0):
+        """pd.to_numeric(errors='coerce') of a column, NaN replaced by `fill` unless it is None."""
+        self._check()
+        key = (col, fill)
+        if key not in self._numbers:
+            raw = self._numbers.get((col, None))
+            if raw is None:
+                raw = self._numbers[(col, None)] = pd.to_numeric(self.df[col], errors='coerce')
+            self._numbers[key] = raw if fill is None else raw.fillna(fill)
+        return self._numbers[key]
+
+
+def schema_for(df):
+    """The FrameSchema of `df`, stored on the frame object itself.
+
+    It lives exactly as long as the frame (the pair is an ordinary reference cycle), so there is
+    no process-wide registry to evict or to confuse by id reuse. pandas neither copies instance
+    attributes to derived frames nor pickles them, unlike df.attrs.
+    """
+    entry = vars(df).get('_frame_schema')
+    if entry is None:
+        entry = vars(df)['_frame_schema'] = FrameSchema(df)
+    return entry
 
 
 def safe_number(val):
@@ -130,6 +312,48 @@ def safe_number(val):
     return n
 
 
+def safe_number_column(series):
+    """safe_number() over a column as a float ndarray, NaN where safe_number() gives None."""
+    if series.dtype.kind in 'iuf':
+        numeric = series.to_numpy(dtype=float, copy=True)
+        numeric[~np.isfinite(numeric)] = np.nan
+        return numeric
+    values = series.to_numpy(dtype=object)
+    is_str = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+    numeric = pd.to_numeric(pd.Series(np.where(is_str, None, values)), errors='coerce').to_numpy(dtype=float, copy=True)
+    numeric[~np.isfinite(numeric)] = np.nan
+    # Text cells (thousands separators, padding) and anything to_numeric() could not read take
+    # the scalar path, so the result matches safe_number() cell for cell.
+    for i in np.flatnonzero(np.isnan(numeric) & pd.notna(values)):
+        n = safe_number(values[i])
+        numeric[i] = np.nan if n is None else n
+    return numeric
+
+
+def exact_sum(values):
+    """sum((safe_number(v) or 0) for v in values) for a float column; int 0 when nothing is non-zero."""
+    return sum(v for v in values.tolist() if v == v and v)
+
+
+def frame_records(frame):
+    """Rows of `frame` as dicts in column order, with NaN turned into None."""
+    columns = []
+    for c in frame.columns:
+        values = frame[c].tolist()
+        if frame[c].dtype.kind == 'f':
+            values = [None if v != v else v for v in values]
+        columns.append(values)
+    return [dict(zip(frame.columns, row)) for row in zip(*columns)]
+
+
+def top_records(frame, key, top_n=TOP_N):
+    """Rows with a non-zero `key`, largest first (ties keep row order), as dicts."""
+    if frame.empty:
+        return []
+    vals = frame[key]
+    return frame_records(frame[vals.notna() & (vals != 0)].nlargest(top_n, key, keep='first'))
+
+
 def safe_div(num, denom):
     n = safe_number(num)
     d = safe_number(denom)
@@ -146,21 +370,18 @@ def clamp(val, low, high):
 
 def percentile(values, p):
     vals = [safe_number(v) for v in values if safe_number(v) is not None]
-    if not vals:
-        return None
     vals.sort()
-    if p <= 0:
-        return vals[0]
-    if p >= 100:
-        return vals[-1]
-    k = (len(vals) - 1) * p / 100.0
-    f = math.floor(k)
-    c = math.ceil(k)
-    if f == c:
-        return vals[int(k)]
-    d0 = vals[int(f)] * (c - k)
-    d1 = vals[int(c)] * (k - f)
-    return d0 + d1
+    return quantile_sketch.percentile_sorted(vals, p)
+
+
+def group_exact_sums(keys, values):
+    """Per-key exact_sum() of `values`, keys in first-appearance order, each group summed in row order."""
+    codes, uniques = pd.factorize(keys)
+    if not len(uniques):
+        return []
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+    return list(zip(uniques.tolist(), (exact_sum(g) for g in np.split(values[order], bounds))))
 
 
 def parse_date_series(series):
@@ -191,8 +412,9 @@ def align_monthly_series(months, values_by_month):
 def build_monthly_sum(df, date_col, amount_col, start, end, abs_value=False):
     if date_col is None or amount_col is None:
         return [], []
-    dates = parse_date_series(df[date_col])
-    amt = pd.to_numeric(df[amount_col], errors='coerce').fillna(0)
+    schema = schema_for(df)
+    dates = schema.dates(date_col)
+    amt = schema.numbers(amount_col)
     if abs_value:
         amt = amt.abs()
     months = dates.dt.to_period('M').astype(str)
@@ -225,19 +447,48 @@ def detect_segment_column(df):
     ])
 
 
+class CfClassifier(KeywordRules):
+    """Cash-flow class rules (keyword_rules.KeywordRules), memoized per distinct (counterparty, memo, type)."""
+
+    label_key = 'cf_class'
+    default_label = 'operating'
+
+    def lookup(self, counterparty, memo, txn_type):
+        key = (counterparty, memo, txn_type)
+        cf_class = self._memo.get(key)
+        if cf_class is None:
+            cf_class = self._memo[key] = self.classify(' '.join(key))
+        return cf_class
+
+    def classify_columns(self, counterparties, memos, types):
+        """Classify aligned Series of normalized text; each distinct triple is classified once."""
+        # \x1f (unit separator) cannot occur in the cells, so the joined key is unambiguous.
+        codes, uniques = pd.factorize(counterparties + '\x1f' + memos + '\x1f' + types)
+        classes = np.array([self.lookup(*key.split('\x1f')) for key in uniques], dtype=object)
+        for cf_class, n in zip(classes, np.bincount(codes, minlength=len(uniques))):
+            self.hits[cf_class] = self.hits.get(cf_class, 0) + int(n)
+        return classes[codes]
+
+    def report(self):
+        return {
+            'rules_version': self.version,
+            'distinct_triples': len(self._memo),
+            'hits': dict(self.hits),
+        }
+
+
+_CF_CLASSIFIER = None
+
+
+def get_cf_classifier():
+    global _CF_CLASSIFIER
+    if _CF_CLASSIFIER is None:
+        _CF_CLASSIFIER = CfClassifier.from_file(CF_RULES)
+    return _CF_CLASSIFIER
+
+
 def detect_cf_class(counterparty, memo, txn_type):
-    text = ' '.join([normalize_text(counterparty), normalize_text(memo), normalize_text(txn_type)])
-    if not text:
-        return 'unknown'
-    if any(k in text for k in ['内部', '关联', '往来', '同名', '调拨']):
-        return 'internal'
-    if any(k in text for k in ['融资', '借款', '贷款', '还款', '利息', '担保', '保证金', '承兑', '票据']):
-        return 'financing'
-    if any(k in text for k in ['投资', '理财', '股权', '固定资产', '设备', '装修', '购置']):
-        return 'investing'
-    if any(k in text for k in ['其他', '杂项', '未知', '暂挂']):
-        return 'unknown'
-    return 'operating'
+    return get_cf_classifier().lookup(normalize_text(counterparty), normalize_text(memo), normalize_text(txn_type))
 
 
 def detect_cf_subclass(txn_type, memo):
@@ -255,17 +506,12 @@ def fmt_num(val, digits=0):
     return f"{n:.{digits}f}"
 
 
-def build_top_list(rows, key, top_n=TOP_N):
-    rows = [r for r in rows if safe_number(r.get(key)) not in (None, 0)]
-    rows.sort(key=lambda r: safe_number(r.get(key)) or 0, reverse=True)
-    return rows[:top_n]
-
-
 def build_last_date_map(bank_df, date_col, name_col, amount_col, direction='in'):
     if date_col is None or name_col is None or amount_col is None:
         return {}
-    dates = parse_date_series(bank_df[date_col])
-    amounts = pd.to_numeric(bank_df[amount_col], errors='coerce').fillna(0)
+    schema = schema_for(bank_df)
+    dates = schema.dates(date_col)
+    amounts = schema.numbers(amount_col)
     names = bank_df[name_col].fillna('')
     records = {}
     for d, name, amt in zip(dates, names, amounts):
@@ -285,62 +531,84 @@ def build_last_date_map(bank_df, date_col, name_col, amount_col, direction='in')
     return records
 
 
-def build_bank_txns(df_bank, period_start, period_end):
+TXN_FIELDS = ['txn_id', 'date', 'month', 'direction', 'amount', 'amount_abs', 'counterparty', 'memo',
+              'cf_class', 'cf_subclass', 'match_status']
+
+
+def _text_column(df, col):
+    if col is None:
+        return pd.Series([''] * len(df), dtype=object)
+    return df[col].fillna('').reset_index(drop=True).astype(str).str.strip()
+
+
+def build_bank_txn_frame(df_bank, period_start, period_end):
+    """Bank transactions as one row per txn with TXN_FIELDS columns, built with whole-column operations.
+
+    Rows keep the source order; txn_id is the 1-based position in df_bank, so it is stable
+    regardless of which rows the period filter or zero-amount check drop.
+    """
     if df_bank is None or df_bank.empty:
-        return []
-    date_col = find_column(df_bank, [['日期'], ['记账日期'], ['业务日期']])
-    income_col = find_column(df_bank, [['收入', '本位币'], ['收入金额'], ['收款']])
-    out_col = find_column(df_bank, [['支出', '本位币'], ['支出金额'], ['付款']])
-    type_col = find_column(df_bank, [['类型'], ['业务类型'], ['单据类型']])
-    name_col = find_column(df_bank, [['对方单位'], ['对方名称'], ['往来单位'], ['对方']])
-    memo_col = find_column(df_bank, [['摘要'], ['用途'], ['备注'], ['说明']])
-    match_col = find_column(df_bank, [['对账状态'], ['匹配状态'], ['核对状态'], ['勾稽状态']])
-
-    dates = parse_date_series(df_bank[date_col]) if date_col else pd.Series([pd.NaT] * len(df_bank))
-    incomes = pd.to_numeric(df_bank[income_col], errors='coerce').fillna(0) if income_col else pd.Series([0] * len(df_bank))
-    outs = pd.to_numeric(df_bank[out_col], errors='coerce').fillna(0).abs() if out_col else pd.Series([0] * len(df_bank))
-    names = df_bank[name_col].fillna('') if name_col else pd.Series([''] * len(df_bank))
-    memos = df_bank[memo_col].fillna('') if memo_col else pd.Series([''] * len(df_bank))
-    types = df_bank[type_col].fillna('') if type_col else pd.Series([''] * len(df_bank))
-    matches = df_bank[match_col].fillna('') if match_col else pd.Series([''] * len(df_bank))
-
-    start_dt = datetime.strptime(period_start, '%Y-%m-%d').date() if period_start else None
-    end_dt = datetime.strptime(period_end, '%Y-%m-%d').date() if period_end else None
-
-    txns = []
-    for idx, (d, inc, out, name, memo, typ, match_status) in enumerate(zip(dates, incomes, outs, names, memos, types, matches)):
-        if pd.isna(d):
-            continue
-        d_date = d.date()
-        if start_dt and d_date < start_dt:
-            continue
-        if end_dt and d_date > end_dt:
-            continue
-        inc_val = safe_number(inc) or 0
-        out_val = safe_number(out) or 0
-        if inc_val == 0 and out_val == 0:
-            continue
-        direction = 'in' if inc_val >= out_val else 'out'
-        amount = inc_val if inc_val >= out_val else -out_val
-        counterparty = normalize_text(name)
-        memo_text = normalize_text(memo)
-        txn_type = normalize_text(typ)
-        cf_class = detect_cf_class(counterparty, memo_text, txn_type)
-        cf_subclass = detect_cf_subclass(txn_type, memo_text)
-        txns.append({
-            'txn_id': f"BK{idx + 1:06d}",
-            'date': d.strftime('%Y-%m-%d'),
-            'month': d.strftime('%Y-%m'),
-            'direction': direction,
-            'amount': amount,
-            'amount_abs': abs(amount),
-            'counterparty': counterparty,
-            'memo': memo_text,
-            'cf_class': cf_class,
-            'cf_subclass': cf_subclass,
-            'match_status': normalize_text(match_status)
-        })
-    return txns
+        return pd.DataFrame(columns=TXN_FIELDS)
+    schema = schema_for(df_bank)
+    n = len(df_bank)
+    date_col = schema.field('date')
+    income_col = schema.field('income')
+    out_col = schema.field('outflow')
+
+    dates = schema.dates(date_col).to_numpy() if date_col else np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]')
+    incomes = schema.numbers(income_col).to_numpy(dtype=float) if income_col else np.zeros(n)
+    outs = np.abs(schema.numbers(out_col).to_numpy(dtype=float)) if out_col else np.zeros(n)
+    # safe_number() treats inf as missing, i.e. 0.
+    incomes = np.where(np.isfinite(incomes), incomes, 0.0)
+    outs = np.where(np.isfinite(outs), outs, 0.0)
+
+    days = dates.astype('datetime64[D]')
+    keep = ~np.isnat(dates) & ((incomes != 0) | (outs != 0))
+    if period_start:
+        keep &= days >= np.datetime64(period_start, 'D')
+    if period_end:
+        keep &= days <= np.datetime64(period_end, 'D')
+    pos = np.flatnonzero(keep)
+
+    incomes, outs = incomes[pos], outs[pos]
+    is_in = incomes >= outs
+    amount = np.where(is_in, incomes, -outs)
+    day_str = pd.Series(days[pos].astype(str))
+    names = _text_column(df_bank, schema.field('counterparty')).iloc[pos].reset_index(drop=True)
+    memos = _text_column(df_bank, schema.field('memo')).iloc[pos].reset_index(drop=True)
+    types = _text_column(df_bank, schema.field('type')).iloc[pos].reset_index(drop=True)
+    matches = _text_column(df_bank, schema.field('match')).iloc[pos].reset_index(drop=True)
+
+    subclass = np.where(types != '', types, np.where(memos != '', memos.str[:16], '未分类'))
+    return pd.DataFrame({
+        'txn_id': pd.Series(pos + 1).map('BK{:06d}'.format),
+        'date': day_str,
+        'month': day_str.str[:7],
+        'direction': np.where(is_in, 'in', 'out'),
+        'amount': amount,
+        'amount_abs': np.abs(amount),
+        'counterparty': names,
+        'memo': memos,
+        'cf_class': get_cf_classifier().classify_columns(names, memos, types),
+        'cf_subclass': subclass,
+        'match_status': matches
+    }, columns=TXN_FIELDS)
+
+
+def txn_records(frame):
+    """Materialize build_bank_txn_frame() rows as the txn dicts written to finance_latest.json."""
+    columns = [frame[c].tolist() for c in TXN_FIELDS]
+    records = [dict(zip(TXN_FIELDS, values)) for values in zip(*columns)]
+    for t in records:
+        # The row loop this replaces produced int 0 for an outflow row with a zero outflow
+        # (negative income); keep that so the JSON stays byte-identical.
+        if t['amount'] == 0:
+            t['amount'] = t['amount_abs'] = 0
+    return records
+
+
+def build_bank_txns(df_bank, period_start, period_end):
+    return txn_records(build_bank_txn_frame(df_bank, period_start, period_end))
 
 
 def build_monthly_from_txns(txns):
@@ -371,16 +639,85 @@ def build_monthly_from_txns(txns):
     return totals, by_class
 
 
-def match_last_date(name, last_date_map):
-    if not name:
-        return None
-    s = str(name)
-    best = None
-    for key, dt in last_date_map.items():
-        if key and (key in s or s in key):
-            if best is None or dt > best:
-                best = dt
-    return best
+class LastDateIndex:
+    """Latest bank date per counterparty, matched the loose way AR/AP names need.
+
+    A bank name matches when it is a substring of the query or contains it; among all matches
+    the latest date wins (ties keep the earlier bank name). Instead of scanning every bank
+    name per query, names that are substrings of the query are found by dict lookups of the
+    query's substrings (only at lengths some bank name has), and names containing the query
+    come from an inverted index on characters/bigrams, verified with `in`. Results are memoized.
+    """
+
+    def __init__(self, last_date_map):
+        self.dates = dict(last_date_map)
+        self.order = {key: i for i, key in enumerate(self.dates)}
+        self.lengths = sorted({len(key) for key in self.dates})
+        self.grams = {}
+        for key in self.dates:
+            for gram in set(key) | {key[i:i + 2] for i in range(len(key) - 1)}:
+                self.grams.setdefault(gram, []).append(key)
+        self._memo = {}
+
+    def _candidates(self, s):
+        for size in self.lengths:
+            if size > len(s):
+                break
+            for i in range(len(s) - size + 1):
+                if s[i:i + size] in self.dates:
+                    yield s[i:i + size]
+        if len(s) == 1:
+            yield from self.grams.get(s, ())
+            return
+        postings = [self.grams.get(s[i:i + 2], ()) for i in range(len(s) - 1)]
+        for key in min(postings, key=len):
+            if s in key:
+                yield key
+
+    def match(self, name):
+        """Return (latest date, matched bank name), or (None, None)."""
+        if not name:
+            return None, None
+        s = str(name)
+        hit = self._memo.get(s)
+        if hit is None:
+            best = None
+            for key in self._candidates(s):
+                rank = (self.dates[key], -self.order[key])
+                if best is None or rank > best[0]:
+                    best = (rank, key)
+            hit = self._memo[s] = (best[0][0], best[1]) if best else (None, None)
+        return hit
+
+
+def _ledger_numbers(df, col):
+    if col is None:
+        return np.full(len(df), np.nan)
+    return safe_number_column(df[col])
+
+
+def _ledger_text(df, col):
+    return df[col].map(normalize_text) if col is not None else pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def classify_segment_column(series):
+    """classify_segment() over a column."""
+    text = series.astype(str)
+    nonstore = text.str.contains('非门', regex=False).to_numpy()
+    store = (text.str.contains('门店', regex=False) | (text.str.contains('店', regex=False) & text.str.contains('门', regex=False))).to_numpy()
+    return np.where(nonstore, 'nonstore', np.where(store, 'store', None)).astype(object)
+
+
+def _last_date_columns(names, index, period_end):
+    """(date strings, matched bank names, days since period_end) for each ledger name."""
+    pe = datetime.strptime(period_end, '%Y-%m-%d').date() if period_end else None
+    last, matched, days = [], [], []
+    for name in names:
+        last_dt, bank_name = index.match(name)
+        last.append(last_dt.strftime('%Y-%m-%d') if last_dt is not None else None)
+        matched.append(bank_name)
+        days.append((pe - last_dt.date()).days if last_dt is not None and pe else None)
+    return last, matched, days
 
 
 def build_ar_segments(df_ar, df_bank, sales_trend, period_start, period_end):
@@ -393,58 +730,57 @@ def build_ar_segments(df_ar, df_bank, sales_trend, period_start, period_end):
     ending_pre_col = find_column(df_ar, [['期末', '预收'], ['预收']])
     opening_col = find_column(df_ar, [['期初', '应收'], ['期初', '应收净额'], ['期初', '应收余额']])
 
-    bank_date_col = find_column(df_bank, [['日期'], ['记账日期'], ['业务日期']])
-    bank_name_col = find_column(df_bank, [['对方单位'], ['对方名称'], ['往来单位'], ['对方']])
-    bank_income_col = find_column(df_bank, [['收入', '本位币'], ['收入金额'], ['收款']])
+    bank_schema = schema_for(df_bank)
+    bank_date_col = bank_schema.field('date')
+    bank_name_col = bank_schema.field('counterparty')
+    bank_income_col = bank_schema.field('income')
 
     last_receipt_map = build_last_date_map(df_bank, bank_date_col, bank_name_col, bank_income_col, direction='in') if df_bank is not None else {}
+    receipt_index = LastDateIndex(last_receipt_map)
 
-    rows = []
+    ledger = pd.DataFrame(columns=['customer', 'customer_code', 'ending_net_ar', 'ending_sales_ar', 'ending_other_ar',
+                                   'ending_pre_receipt', 'ending_balance', 'change', 'last_receipt',
+                                   'last_receipt_counterparty', 'days_since_last_receipt', 'segment'])
     if df_ar is not None and cust_col is not None:
-        for _, r in df_ar.iterrows():
-            customer = normalize_text(r.get(cust_col))
-            if not customer:
-                continue
-            ending_net = safe_number(r.get(ending_net_col))
-            ending_sales = safe_number(r.get(ending_sales_col))
-            ending_other = safe_number(r.get(ending_other_col))
-            ending_pre = safe_number(r.get(ending_pre_col))
-            ending_balance = ending_net if ending_net is not None else (ending_sales if ending_sales is not None else None)
-            opening = safe_number(r.get(opening_col)) if opening_col else None
-            change = (ending_balance - opening) if ending_balance is not None and opening is not None else None
-            seg = classify_segment(r.get(seg_col)) if seg_col else None
-            last_dt = match_last_date(customer, last_receipt_map)
-            last_receipt = last_dt.strftime('%Y-%m-%d') if last_dt is not None else None
-            days_since = None
-            if last_dt is not None and period_end:
-                pe = datetime.strptime(period_end, '%Y-%m-%d')
-                days_since = (pe.date() - last_dt.date()).days
-
-            row = {
-                'customer': customer,
-                'customer_code': normalize_text(r.get(cust_code_col)) if cust_code_col else None,
-                'ending_net_ar': ending_net,
-                'ending_sales_ar': ending_sales,
-                'ending_other_ar': ending_other,
-                'ending_pre_receipt': ending_pre,
-                'ending_balance': ending_balance,
-                'change': change,
-                'last_receipt': last_receipt,
-                'days_since_last_receipt': days_since,
-                'segment': seg
-            }
-            rows.append(row)
+        customers = df_ar[cust_col].map(normalize_text)
+        df = df_ar[(customers != '').to_numpy()]
+        customers = customers[customers != '']
+        ending_net = _ledger_numbers(df, ending_net_col)
+        ending_sales = _ledger_numbers(df, ending_sales_col)
+        ending_balance = np.where(np.isnan(ending_net), ending_sales, ending_net)
+        opening = _ledger_numbers(df, opening_col)
+        last_receipt, receipt_names, days_since = _last_date_columns(customers.tolist(), receipt_index, period_end)
+        ledger = pd.DataFrame({
+            'customer': customers.to_numpy(),
+            'customer_code': _ledger_text(df, cust_code_col).to_numpy(),
+            'ending_net_ar': ending_net,
+            'ending_sales_ar': ending_sales,
+            'ending_other_ar': _ledger_numbers(df, ending_other_col),
+            'ending_pre_receipt': _ledger_numbers(df, ending_pre_col),
+            'ending_balance': ending_balance,
+            'change': ending_balance - opening,
+            'last_receipt': pd.Series(last_receipt, dtype=object),
+            'last_receipt_counterparty': pd.Series(receipt_names, dtype=object),
+            'days_since_last_receipt': pd.Series(days_since, dtype=object),
+            'segment': classify_segment_column(df[seg_col]) if seg_col else pd.Series([None] * len(df), dtype=object)
+        })
 
-    def build_segment(seg_key):
-        seg_rows = [r for r in rows if r.get('segment') == seg_key] if seg_col else rows
-        top_customers = build_top_list(seg_rows, 'ending_balance')
-        top_other = build_top_list(seg_rows, 'ending_other_ar')
-        kpi = {
-            'ending_net_ar': sum((safe_number(r.get('ending_net_ar')) or 0) for r in seg_rows) if seg_rows else None,
-            'ending_sales_ar': sum((safe_number(r.get('ending_sales_ar')) or 0) for r in seg_rows) if seg_rows else None,
-            'ending_other_ar': sum((safe_number(r.get('ending_other_ar')) or 0) for r in seg_rows) if seg_rows else None,
-            'ending_pre_receipt': sum((safe_number(r.get('ending_pre_receipt')) or 0) for r in seg_rows) if seg_rows else None,
+    kpi_cols = ['ending_net_ar', 'ending_sales_ar', 'ending_other_ar', 'ending_pre_receipt']
+    # One groupby for the per-segment KPIs. Without a segment column every segment is the whole ledger.
+    if seg_col:
+        values = {c: ledger[c].to_numpy() for c in kpi_cols}
+        kpis = {
+            seg: {c: exact_sum(values[c][pos]) for c in kpi_cols}
+            for seg, pos in ledger.groupby('segment', sort=False).indices.items()
         }
+    else:
+        kpis = {key: {c: exact_sum(ledger[c]) for c in kpi_cols} for key in ('total', 'store', 'nonstore')} if len(ledger) else {}
+
+    def build_segment(seg_key):
+        seg_rows = ledger[(ledger['segment'] == seg_key).to_numpy()] if seg_col else ledger
+        top_customers = top_records(seg_rows, 'ending_balance')
+        top_other = top_records(seg_rows, 'ending_other_ar')
+        kpi = kpis.get(seg_key) or {c: None for c in kpi_cols}
         trend = {
             'months': sales_trend.get(seg_key, {}).get('months', []),
             'sales_invoiced': sales_trend.get(seg_key, {}).get('sales_invoiced', []),
@@ -474,48 +810,45 @@ def build_ap(df_ap, df_bank, po_trend, period_start, period_end):
     ending_prepay_col = find_column(df_ap, [['期末', '预付'], ['预付']])
     opening_col = find_column(df_ap, [['期初', '应付'], ['期初', '应付净额'], ['期初', '应付余额']])
 
-    bank_date_col = find_column(df_bank, [['日期'], ['记账日期'], ['业务日期']])
-    bank_name_col = find_column(df_bank, [['对方单位'], ['对方名称'], ['往来单位'], ['对方']])
-    bank_out_col = find_column(df_bank, [['支出', '本位币'], ['支出金额'], ['付款']])
+    bank_schema = schema_for(df_bank)
+    bank_date_col = bank_schema.field('date')
+    bank_name_col = bank_schema.field('counterparty')
+    bank_out_col = bank_schema.field('outflow')
 
     last_payment_map = build_last_date_map(df_bank, bank_date_col, bank_name_col, bank_out_col, direction='out') if df_bank is not None else {}
+    payment_index = LastDateIndex(last_payment_map)
 
-    rows = []
+    ledger = pd.DataFrame(columns=['supplier', 'ending_net_ap', 'ending_purchase_ap', 'ending_other_ap', 'ending_prepay',
+                                   'purchase_ap_balance', 'other_ap_balance', 'prepay_balance', 'ending_balance',
+                                   'last_payment', 'last_payment_counterparty', 'days_since_last_payment', 'change'])
     if df_ap is not None and sup_col is not None:
-        for _, r in df_ap.iterrows():
-            supplier = normalize_text(r.get(sup_col))
-            if not supplier:
-                continue
-            ending_net = safe_number(r.get(ending_net_col))
-            ending_purchase = safe_number(r.get(ending_purchase_col))
-            ending_other = safe_number(r.get(ending_other_col))
-            ending_prepay = safe_number(r.get(ending_prepay_col))
-            ending_balance = ending_net if ending_net is not None else (ending_purchase if ending_purchase is not None else None)
-            opening = safe_number(r.get(opening_col)) if opening_col else None
-            last_dt = match_last_date(supplier, last_payment_map)
-            last_payment = last_dt.strftime('%Y-%m-%d') if last_dt is not None else None
-            days_since = None
-            if last_dt is not None and period_end:
-                pe = datetime.strptime(period_end, '%Y-%m-%d')
-                days_since = (pe.date() - last_dt.date()).days
-            row = {
-                'supplier': supplier,
-                'ending_net_ap': ending_net,
-                'ending_purchase_ap': ending_purchase,
-                'ending_other_ap': ending_other,
-                'ending_prepay': ending_prepay,
-                'purchase_ap_balance': ending_purchase,
-                'other_ap_balance': ending_other,
-                'prepay_balance': ending_prepay,
-                'ending_balance': ending_balance,
-                'last_payment': last_payment,
-                'days_since_last_payment': days_since,
-                'change': (ending_balance - opening) if ending_balance is not None and opening is not None else None
-            }
-            rows.append(row)
-
-    top_suppliers = build_top_list(rows, 'ending_balance')
-    top_other = build_top_list(rows, 'ending_other_ap')
+        suppliers = df_ap[sup_col].map(normalize_text)
+        df = df_ap[(suppliers != '').to_numpy()]
+        suppliers = suppliers[suppliers != '']
+        ending_net = _ledger_numbers(df, ending_net_col)
+        ending_purchase = _ledger_numbers(df, ending_purchase_col)
+        ending_other = _ledger_numbers(df, ending_other_col)
+        ending_prepay = _ledger_numbers(df, ending_prepay_col)
+        ending_balance = np.where(np.isnan(ending_net), ending_purchase, ending_net)
+        last_payment, payment_names, days_since = _last_date_columns(suppliers.tolist(), payment_index, period_end)
+        ledger = pd.DataFrame({
+            'supplier': suppliers.to_numpy(),
+            'ending_net_ap': ending_net,
+            'ending_purchase_ap': ending_purchase,
+            'ending_other_ap': ending_other,
+            'ending_prepay': ending_prepay,
+            'purchase_ap_balance': ending_purchase,
+            'other_ap_balance': ending_other,
+            'prepay_balance': ending_prepay,
+            'ending_balance': ending_balance,
+            'last_payment': pd.Series(last_payment, dtype=object),
+            'last_payment_counterparty': pd.Series(payment_names, dtype=object),
+            'days_since_last_payment': pd.Series(days_since, dtype=object),
+            'change': ending_balance - _ledger_numbers(df, opening_col)
+        })
+
+    top_suppliers = top_records(ledger, 'ending_balance')
+    top_other = top_records(ledger, 'ending_other_ap')
 
     trend = {
         'months': po_trend.get('months', []),
@@ -523,12 +856,8 @@ def build_ap(df_ap, df_bank, po_trend, period_start, period_end):
         'cash_payments': po_trend.get('cash_payments', [])
     }
 
-    kpi = {
-        'ending_net_ap': sum((safe_number(r.get('ending_net_ap')) or 0) for r in rows) if rows else None,
-        'ending_purchase_ap': sum((safe_number(r.get('ending_purchase_ap')) or 0) for r in rows) if rows else None,
-        'ending_other_ap': sum((safe_number(r.get('ending_other_ap')) or 0) for r in rows) if rows else None,
-        'ending_prepay': sum((safe_number(r.get('ending_prepay')) or 0) for r in rows) if rows else None,
-    }
+    kpi_cols = ['ending_net_ap', 'ending_purchase_ap', 'ending_other_ap', 'ending_prepay']
+    kpi = {c: exact_sum(ledger[c]) if len(ledger) else None for c in kpi_cols}
 
     return {
         'kpi': kpi,
@@ -539,10 +868,11 @@ def build_ap(df_ap, df_bank, po_trend, period_start, period_end):
 
 
 def build_bank(df_bank, period_start, period_end):
-    date_col = find_column(df_bank, [['日期'], ['记账日期'], ['业务日期']])
-    income_col = find_column(df_bank, [['收入', '本位币'], ['收入金额'], ['收款']])
-    out_col = find_column(df_bank, [['支出', '本位币'], ['支出金额'], ['付款']])
-    type_col = find_column(df_bank, [['类型'], ['业务类型'], ['摘要'], ['用途']])
+    schema = schema_for(df_bank)
+    date_col = schema.field('date')
+    income_col = schema.field('income')
+    out_col = schema.field('outflow')
+    type_col = schema.find([['类型'], ['业务类型'], ['摘要'], ['用途']])
 
     months, cash_in = build_monthly_sum(df_bank, date_col, income_col, period_start, period_end)
     _, cash_out = build_monthly_sum(df_bank, date_col, out_col, period_start, period_end, abs_value=True)
@@ -561,8 +891,8 @@ def build_bank(df_bank, period_start, period_end):
     by_type = []
     if type_col and income_col and out_col:
         df_bank = df_bank.copy()
-        df_bank['_cash_in'] = pd.to_numeric(df_bank[income_col], errors='coerce').fillna(0)
-        df_bank['_cash_out'] = pd.to_numeric(df_bank[out_col], errors='coerce').fillna(0).abs()
+        df_bank['_cash_in'] = schema.numbers(income_col)
+        df_bank['_cash_out'] = schema.numbers(out_col).abs()
         grouped = df_bank.groupby(df_bank[type_col].fillna('未知'))
         for name, g in grouped:
             by_type.append({
@@ -605,28 +935,198 @@ def calc_penalty(value, t1, t2):
     return 0
 
 
-def build_risk_and_anomalies(bank, txns):
+BASELINE_VERSION = 1
+BASELINE_MONTHS = 24
+BASELINE_MIN_MONTHS = 3
+BASELINE_Z = 3.0
+
+
+def shift_month(month, delta):
+    year, mon = (int(x) for x in month.split('-'))
+    idx = year * 12 + mon - 1 + delta
+    return f"{idx // 12:04d}-{idx % 12 + 1:02d}"
+
+
+def load_baselines(path):
+    """Per-counterparty history saved by earlier builds ({} when missing or from another version)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if store.get('version') != BASELINE_VERSION:
+        print(f"Baseline store {path} ignored (version changed)")
+        return {}
+    return store.get('counterparties', {})
+
+
+def save_baselines(path, baselines):
+    ensure_dirs(path)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        json.dump({'version': BASELINE_VERSION, 'counterparties': baselines}, f, ensure_ascii=False, separators=(',', ':'))
+        f.write('\n')
+
+
+def _month_stats(months, first, last):
+    """Mean/variance of monthly counts and amounts from `first` to `last`, missing months as zero."""
+    if not first or first > last:
+        return None
+    counts, amounts = [], []
+    month = first
+    while month <= last:
+        count, amount = months.get(month, (0, 0))
+        counts.append(count)
+        amounts.append(amount)
+        month = shift_month(month, 1)
+    n = len(counts)
+    count_mean = sum(counts) / n
+    amount_mean = sum(amounts) / n
+    return {
+        'months': n,
+        'count_mean': count_mean,
+        'count_var': sum((c - count_mean) ** 2 for c in counts) / n,
+        'amount_mean': amount_mean,
+        'amount_var': sum((a - amount_mean) ** 2 for a in amounts) / n
+    }
+
+
+def update_baselines(baselines, frame):
+    """Fold the txn table into the counterparty baselines; the export replaces the months it covers.
+
+    Every counterparty's entries for those months are dropped first, so one with no rows in a
+    re-exported month loses that month too. Each entry keeps the latest BASELINE_MONTHS months of
+    [count, amount_abs total] plus first/last seen dates and rolling count/amount stats; entries
+    left without months are removed.
+    """
+    if not len(frame):
+        return baselines
+    counterparty = frame['counterparty'].fillna('')
+    names = counterparty.where(counterparty != '', '未命名')
+    months = frame['month'].fillna('')
+    dates = frame['date'].fillna('')
+    keyed = (months != '').to_numpy()
+    pair = (names + '\x1f' + months).to_numpy()[keyed]
+    counts = pd.Series(pair).value_counts().to_dict()
+    sums = dict(group_exact_sums(pair, frame['amount_abs'].to_numpy(dtype=float)[keyed]))
+    seen = pd.DataFrame({'name': names, 'date': dates})[(dates != '').to_numpy()].groupby('name')['date'].agg(['min', 'max'])
+
+    latest = max(months[keyed]) if keyed.any() else None
+    covered = set(months[keyed].tolist())
+    touched = set()
+    for name, entry in baselines.items():
+        if covered.intersection(entry['months']):
+            entry['months'] = {m: v for m, v in entry['months'].items() if m not in covered}
+            touched.add(name)
+    for key, count in counts.items():
+        name, month = key.split('\x1f', 1)
+        entry = baselines.setdefault(name, {'first_seen': None, 'last_seen': None, 'months': {}})
+        entry['months'][month] = [int(count), sums[key]]
+    for name, row in seen.iterrows():
+        entry = baselines[name]
+        entry['first_seen'] = min(filter(None, [entry.get('first_seen'), row['min']]))
+        entry['last_seen'] = max(filter(None, [entry.get('last_seen'), row['max']]))
+    cutoff = shift_month(latest, -BASELINE_MONTHS) if latest else None
+    touched.update(seen.index.tolist())
+    for name in touched:
+        entry = baselines[name]
+        entry['months'] = {m: v for m, v in sorted(entry['months'].items()) if not cutoff or m > cutoff}
+        stored = list(entry['months'])
+        if not stored:
+            del baselines[name]
+            continue
+        entry['stats'] = _month_stats(entry['months'], stored[0], stored[-1])
+    return baselines
+
+
+class BaselineHistory:
+    """Monthly counterparty counts from the baselines merged with the export being scored.
+
+    Months present in the export come from the export; older months come from the store, so
+    the detectors see history beyond the uploaded file without re-reading old statements.
+    """
+
+    def __init__(self, baselines, names, months):
+        self.baselines = baselines
+        self.export_months = set(months.tolist()) - {''}
+        pairs = pd.DataFrame({'name': names, 'month': months})
+        self.export_counts = pairs[pairs['month'] != ''].value_counts().to_dict()
+
+    def count(self, name, month):
+        if month in self.export_months:
+            return int(self.export_counts.get((name, month), 0))
+        return int((self.baselines.get(name, {}).get('months', {}).get(month) or (0, 0))[0])
+
+    def has_before(self, month):
+        return any(m < month for m in self.export_months) or any(
+            m < month for entry in self.baselines.values() for m in entry.get('months', {}))
+
+    def count_stats(self, name, month):
+        """(months, mean, std) of monthly counts before `month`, from first seen, or None when too short."""
+        start = shift_month(month, -BASELINE_MONTHS)
+        entry = self.baselines.get(name, {})
+        firsts = [m for m in entry.get('months', {}) if m >= start]
+        firsts += [m for m in self.export_months if m >= start and self.export_counts.get((name, m))]
+        first = min([m for m in firsts if m < month], default=None)
+        if first is None:
+            return None
+        counts = []
+        cur = first
+        while cur < month:
+            counts.append(self.count(name, cur))
+            cur = shift_month(cur, 1)
+        if len(counts) < BASELINE_MIN_MONTHS:
+            return None
+        mean = sum(counts) / len(counts)
+        return len(counts), mean, math.sqrt(sum((c - mean) ** 2 for c in counts) / len(counts))
+
+
+def txn_table(txns):
+    """Columns of a txns list the risk engine reads: the txn fields, amounts as floats (NaN = missing)."""
+    frame = pd.DataFrame.from_records(txns, columns=TXN_FIELDS) if txns else pd.DataFrame(columns=TXN_FIELDS)
+    for col in ('amount', 'amount_abs'):
+        frame[col] = safe_number_column(frame[col]) if len(frame) else np.array([], dtype=float)
+    return frame
+
+
+def build_risk_and_anomalies(bank, txns, frame=None, sketch_k=quantile_sketch.DEFAULT_K, baselines=None):
+    """Risk scores and anomaly records from the bank KPIs and the transaction table.
+
+    `frame` is the columnar form of `txns` (build_bank_txn_frame(), same row order); when it is
+    not given it is built from `txns`. Sums run over column masks in row order, so every ratio
+    is bit-for-bit what the per-dict loops produced. The P95 thresholds come from quantile
+    sketches, which are exact up to `sketch_k` values.
+
+    With `baselines` (load_baselines()) the frequency and new-counterparty detectors use calendar
+    months and read months missing from the export out of the store; frequency also flags a
+    count more than BASELINE_Z standard deviations above the counterparty's monthly mean.
+    Without it they only see the months inside the export.
+    """
     kpi = bank.get('kpi', {}) if bank else {}
     trend = bank.get('trend', {}) if bank else {}
     recon = bank.get('recon', {}) if bank else {}
 
-    total_outflow = sum((safe_number(t.get('amount_abs')) or 0) for t in txns if t.get('direction') == 'out')
-    unknown_outflow = sum((safe_number(t.get('amount_abs')) or 0) for t in txns if t.get('direction') == 'out' and t.get('cf_class') == 'unknown')
+    frame = txn_table(txns) if frame is None else frame
+    amount = frame['amount'].to_numpy(dtype=float)
+    amount_abs = frame['amount_abs'].to_numpy(dtype=float)
+    cf_class = frame['cf_class'].to_numpy()
+    is_out = (frame['direction'] == 'out').to_numpy()
+    counterparty = frame['counterparty'].fillna('')
+    names = counterparty.where(counterparty != '', '未命名').to_numpy()
+    months = frame['month'].fillna('').to_numpy()
+
+    total_outflow = exact_sum(amount_abs[is_out])
+    unknown_outflow = exact_sum(amount_abs[is_out & (cf_class == 'unknown')])
     unknown_ratio = safe_div(unknown_outflow, total_outflow)
 
-    internal_in = sum((safe_number(t.get('amount')) or 0) for t in txns if t.get('cf_class') == 'internal' and t.get('amount', 0) > 0)
-    internal_out = sum((safe_number(t.get('amount_abs')) or 0) for t in txns if t.get('cf_class') == 'internal' and t.get('amount', 0) < 0)
+    is_internal = cf_class == 'internal'
+    internal_in = exact_sum(amount[is_internal & (amount > 0)])
+    internal_out = exact_sum(amount_abs[is_internal & (amount < 0)])
     internal_net_abs = abs((internal_in or 0) - (internal_out or 0))
     net_cash = abs(safe_number(kpi.get('period_net_cash')) or 0)
     internal_ratio = safe_div(internal_net_abs, net_cash if net_cash else None)
 
-    counterparty_out = {}
-    for t in txns:
-        if t.get('direction') != 'out':
-            continue
-        name = t.get('counterparty') or '未命名'
-        counterparty_out[name] = counterparty_out.get(name, 0) + (safe_number(t.get('amount_abs')) or 0)
-    top1_outflow = max(counterparty_out.values()) if counterparty_out else None
+    counterparty_out = group_exact_sums(names[is_out], amount_abs[is_out])
+    top1_outflow = max(v for _, v in counterparty_out) if counterparty_out else None
     top1_ratio = safe_div(top1_outflow, total_outflow)
 
     net_series = [safe_number(v) or 0 for v in (trend.get('net_cash') or [])]
@@ -646,7 +1146,7 @@ def build_risk_and_anomalies(bank, txns):
     diff_payments_ratio = safe_div(abs(diff_payments) if diff_payments is not None else None, bank_cash_out)
     recon_ratio = max([r for r in [diff_receipts_ratio, diff_payments_ratio] if r is not None], default=None)
 
-    financing_net = sum((safe_number(t.get('amount')) or 0) for t in txns if t.get('cf_class') == 'financing')
+    financing_net = exact_sum(amount[cf_class == 'financing'])
     financing_ratio = safe_div(abs(financing_net), net_cash if net_cash else None)
 
     penalties = {
@@ -717,43 +1217,60 @@ def build_risk_and_anomalies(bank, txns):
     ]
 
     anomalies = []
-    if txns:
-        target_txns = [t for t in txns if t.get('direction') == 'out' and t.get('cf_class') in ('operating', 'unknown', 'internal')]
-        amounts = [t.get('amount_abs') for t in target_txns]
-        p95 = percentile(amounts, 95)
-        for t in target_txns:
-            amt = safe_number(t.get('amount_abs'))
-            if p95 is not None and amt is not None and amt > p95:
+    if len(frame):
+        txn_ids = frame['txn_id'].to_numpy()
+        dates = frame['date'].to_numpy()
+        memos = frame['memo'].to_numpy()
+        counterparties = frame['counterparty'].to_numpy()
+
+        target = is_out & np.isin(cf_class, ['operating', 'unknown', 'internal'])
+        target_amounts = amount_abs[target]
+        p95 = QuantileSketch(sketch_k).update(target_amounts[~np.isnan(target_amounts)].tolist()).quantile(95)
+        if p95 is not None:
+            for i in np.flatnonzero(target & (amount_abs > p95)).tolist():
+                amt = float(amount_abs[i])
                 anomalies.append({
                     'anomaly_type': '金额异常',
                     'severity': 'high',
-                    'txn_id': t.get('txn_id'),
-                    'cf_class': t.get('cf_class'),
-                    'counterparty': t.get('counterparty'),
-                    'memo': t.get('memo'),
+                    'txn_id': txn_ids[i],
+                    'cf_class': cf_class[i],
+                    'counterparty': counterparties[i],
+                    'memo': memos[i],
                     'amount': amt,
-                    'date': t.get('date'),
+                    'date': dates[i],
                     'reason': f'单笔金额 {amt:.0f} > P95({p95:.0f})',
                     'suggested_action': '核对交易性质与审批链，确认是否需要重新归类。',
-                    'evidence_state_link': build_state({'txn_id': t.get('txn_id')})
+                    'evidence_state_link': build_state({'txn_id': txn_ids[i]})
                 })
 
-        month_list = sorted(set([t.get('month') for t in txns if t.get('month')]))
+        month_list = sorted(set(months.tolist()) - {''})
         if month_list:
             last_month = month_list[-1]
-            prev_month = month_list[-2] if len(month_list) > 1 else None
-            last_counts = {}
+            in_last = months == last_month
+            last_codes, last_names = pd.factorize(names[in_last])
+            last_counts = np.bincount(last_codes, minlength=len(last_names)).tolist()
+            history = None
             prev_counts = {}
-            for t in txns:
-                name = t.get('counterparty') or '未命名'
-                if t.get('month') == last_month:
-                    last_counts[name] = last_counts.get(name, 0) + 1
-                elif prev_month and t.get('month') == prev_month:
-                    prev_counts[name] = prev_counts.get(name, 0) + 1
-            p95_cnt = percentile(list(last_counts.values()), 95) if last_counts else None
-            for name, cnt in last_counts.items():
+            if baselines is not None:
+                history = BaselineHistory(baselines, names, months)
+                prev_month = shift_month(last_month, -1) if history.has_before(last_month) else None
+                history_months = [shift_month(last_month, -d) for d in (3, 2, 1)]
+                prev_counts = {name: history.count(name, prev_month) for name in last_names.tolist()} if prev_month else {}
+            else:
+                prev_month = month_list[-2] if len(month_list) > 1 else None
+                history_months = month_list[-4:-1]
+                if prev_month:
+                    prev_codes, prev_names = pd.factorize(names[months == prev_month])
+                    prev_counts = dict(zip(prev_names.tolist(), np.bincount(prev_codes, minlength=len(prev_names)).tolist()))
+            p95_cnt = QuantileSketch(sketch_k).update(float(c) for c in last_counts).quantile(95)
+            for name, cnt in zip(last_names.tolist(), last_counts):
                 prev = prev_counts.get(name, 0)
-                if (p95_cnt is not None and cnt > p95_cnt) or (prev > 0 and cnt / prev > 2):
+                stats = history.count_stats(name, last_month) if history else None
+                reason = f'本期笔数 {cnt} (上期 {prev})'
+                if stats:
+                    reason = f'本期笔数 {cnt} (上期 {prev}，近{stats[0]}个月月均 {stats[1]:.1f})'
+                if (p95_cnt is not None and cnt > p95_cnt) or (prev > 0 and cnt / prev > 2) or (
+                        stats and cnt > stats[1] + BASELINE_Z * max(stats[2], 1.0)):
                     anomalies.append({
                         'anomaly_type': '频次异常',
                         'severity': 'medium',
@@ -763,27 +1280,21 @@ def build_risk_and_anomalies(bank, txns):
                         'memo': '',
                         'amount': None,
                         'date': last_month,
-                        'reason': f'本期笔数 {cnt} (上期 {prev})',
+                        'reason': reason,
                         'suggested_action': '核对该对手方是否集中支付或异常拆分付款。',
                         'evidence_state_link': build_state({'counterparty': name, 'date_range': {'month': last_month}})
                     })
 
             if prev_month:
-                history_months = month_list[-4:-1]
-                history_set = set()
-                for t in txns:
-                    if t.get('month') in history_months:
-                        if t.get('counterparty'):
-                            history_set.add(t.get('counterparty'))
-                last_amounts = {}
-                for t in txns:
-                    if t.get('month') != last_month:
-                        continue
-                    name = t.get('counterparty') or ''
-                    if not name or name in history_set:
-                        continue
-                    last_amounts[name] = last_amounts.get(name, 0) + (safe_number(t.get('amount_abs')) or 0)
-                top_new = sorted(last_amounts.items(), key=lambda x: x[1], reverse=True)[:20]
+                named = (counterparty != '').to_numpy()
+                if history is not None:
+                    history_set = {name for name in set(counterparty[in_last & named].tolist())
+                                   if any(history.count(name, m) for m in history_months)}
+                else:
+                    history_set = set(counterparty[np.isin(months, history_months) & named].tolist())
+                is_new = in_last & named & ~counterparty.isin(history_set).to_numpy()
+                last_amounts = group_exact_sums(counterparty[is_new].to_numpy(), amount_abs[is_new])
+                top_new = sorted(last_amounts, key=lambda x: x[1], reverse=True)[:20]
                 for name, amt in top_new:
                     anomalies.append({
                         'anomaly_type': '新对手方异常',
@@ -799,24 +1310,23 @@ def build_risk_and_anomalies(bank, txns):
                         'evidence_state_link': build_state({'counterparty': name, 'date_range': {'month': last_month}})
                     })
 
-        for t in txns:
-            memo = t.get('memo') or ''
-            if t.get('cf_class') != 'operating' or not memo:
-                continue
-            if any(k in memo for k in ANOMALY_KEYWORDS):
-                anomalies.append({
-                    'anomaly_type': '备注关键词异常',
-                    'severity': 'low',
-                    'txn_id': t.get('txn_id'),
-                    'cf_class': t.get('cf_class'),
-                    'counterparty': t.get('counterparty'),
-                    'memo': memo,
-                    'amount': safe_number(t.get('amount_abs')),
-                    'date': t.get('date'),
-                    'reason': '备注包含敏感关键词但被归为经营性现金流',
-                    'suggested_action': '核对资金性质，必要时调整现金流分类。',
-                    'evidence_state_link': build_state({'txn_id': t.get('txn_id'), 'memo_contains': memo})
-                })
+        operating = np.flatnonzero(cf_class == 'operating')
+        memo_text = frame['memo'].iloc[operating].fillna('')
+        flagged = operating[memo_text.str.contains('|'.join(map(re.escape, ANOMALY_KEYWORDS)), regex=True).to_numpy()]
+        for i in flagged.tolist():
+            anomalies.append({
+                'anomaly_type': '备注关键词异常',
+                'severity': 'low',
+                'txn_id': txn_ids[i],
+                'cf_class': cf_class[i],
+                'counterparty': counterparties[i],
+                'memo': memos[i],
+                'amount': None if np.isnan(amount_abs[i]) else float(amount_abs[i]),
+                'date': dates[i],
+                'reason': '备注包含敏感关键词但被归为经营性现金流',
+                'suggested_action': '核对资金性质，必要时调整现金流分类。',
+                'evidence_state_link': build_state({'txn_id': txn_ids[i], 'memo_contains': memos[i]})
+            })
 
     risk = {
         'risk_score_total': risk_score_total,
@@ -838,13 +1348,85 @@ def build_risk_and_anomalies(bank, txns):
             if not tid:
                 continue
             tag_map.setdefault(tid, set()).add(a.get('anomaly_type'))
-        for t in txns:
-            tags = tag_map.get(t.get('txn_id'))
-            if tags:
-                t['anomaly_tags'] = list(tags)
+        # Only rows whose txn_id carries an anomaly need visiting; frame rows line up with txns.
+        for i in np.flatnonzero(frame['txn_id'].isin(list(tag_map)).to_numpy()).tolist():
+            t = txns[i]
+            t['anomaly_tags'] = list(tag_map[t.get('txn_id')])
     return risk
 
 
+SKETCH_STORE_VERSION = 1
+
+
+def load_sketch_store(path, k):
+    """Per-month amount sketches saved by earlier runs; empty when missing or built with another k."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if store.get('version') != SKETCH_STORE_VERSION or store.get('k') != k:
+        print(f"Sketch store {path} ignored (version/k changed)")
+        return {}
+    return store.get('months', {})
+
+
+def save_sketch_store(path, k, months):
+    ensure_dirs(path)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        json.dump({'version': SKETCH_STORE_VERSION, 'k': k, 'months': dict(sorted(months.items()))},
+                  f, ensure_ascii=False, separators=(',', ':'))
+        f.write('\n')
+
+
+def build_txn_quantiles(frame, k=quantile_sketch.DEFAULT_K, stored_months=None):
+    """P50/P90/P95/P99 of amount_abs per cf_class, month and counterparty, plus the month sketch store.
+
+    All slices come from one sort of the txn table (sketch_groups). The period's month sketches
+    replace those months in `stored_months`; 'history' merges every stored month, so thresholds
+    can be read over a longer window than the current period.
+    """
+    amounts = frame['amount_abs'].to_numpy(dtype=float)
+    counterparty = frame['counterparty'].fillna('')
+    names = counterparty.where(counterparty != '', '未命名').to_numpy()
+    months = frame['month'].fillna('').to_numpy()
+    cf_class = frame['cf_class'].to_numpy()
+
+    by_class = quantile_sketch.sketch_groups(cf_class, amounts, k)
+    by_month = quantile_sketch.sketch_groups(months, amounts, k)
+    by_counterparty = quantile_sketch.sketch_groups(names, amounts, k)
+    top_counterparties = sorted(by_counterparty.items(), key=lambda x: x[1].n, reverse=True)[:TOP_N]
+
+    store = dict(stored_months or {})
+    for month, sketch in by_month.items():
+        if month:
+            store[month] = {'all': sketch.to_dict(), 'cf_class': {}}
+    month_class = (frame['month'].fillna('') + '\x1f' + frame['cf_class'].fillna('')).to_numpy()
+    for key, sketch in quantile_sketch.sketch_groups(month_class, amounts, k).items():
+        month, cls = key.split('\x1f', 1)
+        if month:
+            store[month]['cf_class'][cls] = sketch.to_dict()
+
+    history = {}
+    for entry in store.values():
+        for cls, data in entry.get('cf_class', {}).items():
+            history.setdefault(cls, QuantileSketch(k)).merge(QuantileSketch.from_dict(data))
+
+    quantiles = {
+        'metric': 'amount_abs',
+        'points': list(quantile_sketch.POINTS),
+        'k': k,
+        'by_cf_class': {cls: s.summary() for cls, s in by_class.items()},
+        'by_month': {m: s.summary() for m, s in sorted(by_month.items()) if m},
+        'by_counterparty': {name: s.summary() for name, s in top_counterparties},
+        'history': {
+            'months': sorted(store),
+            'by_cf_class': {cls: s.summary() for cls, s in history.items()}
+        }
+    }
+    return quantiles, store
+
+
 def build_inventory(df_inv, period_start, period_end):
     date_col = find_column(df_inv, [['日期'], ['业务日期'], ['单据日期']])
     inbound_col = find_column(df_inv, [['入库', '成本'], ['入库', '金额'], ['采购入库']])
@@ -857,16 +1439,17 @@ def build_inventory(df_inv, period_start, period_end):
 
     ending_inventory = []
     if date_col and ending_col:
+        schema = schema_for(df_inv)
         df_inv = df_inv.copy()
-        df_inv['_date'] = parse_date_series(df_inv[date_col])
+        df_inv['_date'] = schema.dates(date_col)
         df_inv['_month'] = df_inv['_date'].dt.to_period('M').astype(str)
-        df_inv['_ending'] = pd.to_numeric(df_inv[ending_col], errors='coerce')
+        df_inv['_ending'] = schema.numbers(ending_col, fill=None)
+        # Stable, so same-day rows keep sheet order and "last" does not depend on the rest of the frame.
+        df_inv = df_inv.sort_values('_date', kind='stable')
         if sku_col:
-            df_inv = df_inv.sort_values('_date')
             last_per_sku = df_inv.groupby(['_month', df_inv[sku_col].fillna('')])['_ending'].last().reset_index()
             grouped = last_per_sku.groupby('_month')['_ending'].sum().to_dict()
         else:
-            df_inv = df_inv.sort_values('_date')
             grouped = df_inv.groupby('_month')['_ending'].last().to_dict()
         ending_inventory = align_monthly_series(months, grouped)
 
@@ -978,8 +1561,9 @@ def compute_sales_trend(df_sales, df_bank, period_start, period_end):
     date_col = find_column(df_sales, [['日期'], ['开票日期'], ['单据日期'], ['业务日期']])
     sales_col = find_column(df_sales, [['价税合计'], ['销售额'], ['开票金额'], ['收入']])
 
-    bank_date_col = find_column(df_bank, [['日期'], ['记账日期'], ['业务日期']])
-    bank_income_col = find_column(df_bank, [['收入', '本位币'], ['收入金额'], ['收款']])
+    bank_schema = schema_for(df_bank)
+    bank_date_col = bank_schema.field('date')
+    bank_income_col = bank_schema.field('income')
 
     sales_months, sales_invoiced = build_monthly_sum(df_sales, date_col, sales_col, period_start, period_end)
     cash_months, cash_receipts = build_monthly_sum(df_bank, bank_date_col, bank_income_col, period_start, period_end)
@@ -1214,6 +1798,84 @@ def next_version(prefix):
     return max_v + 1
 
 
+PROFILE = {'enabled': False, 'cprofile_dir': None, 'stages': []}
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+@contextmanager
+def profile_stage(name, rows_in=None):
+    """Record wall/CPU time, peak RSS growth and row counts for one stage when --profile is on.
+
+    The block may set info['rows_out'] (and correct info['rows_in']) once its result is known.
+    """
+    info = {'rows_in': rows_in, 'rows_out': None}
+    if not PROFILE['enabled']:
+        yield info
+        return
+    prof = cProfile.Profile() if PROFILE['cprofile_dir'] else None
+    rss0 = peak_rss_kb()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    if prof:
+        prof.enable()
+    try:
+        yield info
+    finally:
+        if prof:
+            prof.disable()
+        entry = {
+            'stage': name,
+            'wall_s': round(time.perf_counter() - wall0, 4),
+            'cpu_s': round(time.process_time() - cpu0, 4),
+            'peak_rss_delta_mb': round((peak_rss_kb() - rss0) / 1024, 2),
+            'rows_in': info['rows_in'],
+            'rows_out': info['rows_out'],
+        }
+        entry.update((k, v) for k, v in info.items() if k not in entry)
+        if prof:
+            os.makedirs(PROFILE['cprofile_dir'], exist_ok=True)
+            prof_path = os.path.join(PROFILE['cprofile_dir'], f"{len(PROFILE['stages']) + 1:02d}_{name}.prof")
+            prof.dump_stats(prof_path)
+            stats = pstats.Stats(prof)
+            top = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:10]
+            entry['cprofile'] = prof_path
+            entry['top_cumulative'] = [
+                {'function': f"{os.path.basename(fn)}:{line}:{func}", 'calls': nc, 'cum_s': round(ct, 4)}
+                for (fn, line, func), (_, nc, _, ct, _) in top
+            ]
+        PROFILE['stages'].append(entry)
+
+
+def write_profile(path, meta, total_wall, total_cpu):
+    stages = PROFILE['stages']
+    report = {
+        'generated_at': meta.get('generated_at'),
+        'period_start': meta.get('period_start'),
+        'period_end': meta.get('period_end'),
+        'argv': sys.argv[1:],
+        'total_wall_s': round(total_wall, 4),
+        'total_cpu_s': round(total_cpu, 4),
+        'peak_rss_mb': round(peak_rss_kb() / 1024, 1),
+        'stages': stages,
+    }
+    dump_json(path, report)
+    # One line per run, so nightly builds accumulate a history of where the time goes.
+    history = os.path.join(os.path.dirname(path), 'build_profile_history.jsonl')
+    line = dict(report)
+    line['stages'] = [{k: v for k, v in st.items() if k != 'top_cumulative'} for st in stages]
+    with open(history, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(sanitize(line), ensure_ascii=False) + '\n')
+    print('=== Build Profile ===')
+    for st in stages:
+        print(f"{st['stage']:<24} wall {st['wall_s']:>8.3f}s  cpu {st['cpu_s']:>8.3f}s  "
+              f"rss +{st['peak_rss_delta_mb']:>7.2f} MB  rows {st['rows_in']} -> {st['rows_out']}")
+    print(f"total wall {total_wall:.3f}s cpu {total_cpu:.3f}s -> {path}")
+
+
 def render_bp_html(finance, period_start, period_end, template_path=None):
     title = f"财务BP报告（截至 {period_end}）" if period_end else '财务BP报告'
     meta = finance.get('meta', {})
@@ -1419,23 +2081,50 @@ def main():
     parser.add_argument('--period-start', required=True, help='YYYY-MM-DD')
     parser.add_argument('--period-end', required=True, help='YYYY-MM-DD')
     parser.add_argument('--out-root', default='.', help='输出目录根路径')
+    parser.add_argument('--no-cache', action='store_true', help='不读写解析缓存，强制重新解析全部 Excel')
+    parser.add_argument('--cache-dir', default=str(parse_cache.DEFAULT_DIR), help='解析缓存目录（按文件 sha256 + 读取参数索引）')
+    parser.add_argument('--workers', type=int, default=0, help='并行读取六张 Excel 的进程数（0 = CPU 核数，1 = 顺序读取）')
+    parser.add_argument('--cf-rules', default=CF_RULES, help='现金流分类关键词规则文件（JSON，含 version）')
+    parser.add_argument('--baselines', nargs='?', const='',
+                        help='读写对手方历史基线，频次/新对手方异常参考导出之前的月份；不带路径时用 '
+                             '<out-root>/data/counterparty_baselines.json。不指定则只看本次导出的月份')
+    parser.add_argument('--quantile-k', type=int, default=quantile_sketch.DEFAULT_K,
+                        help='分位数草图容量：样本数不超过该值时精确，超过后秩误差约 log2(n/k)/k')
+    parser.add_argument('--sketch-store', nargs='?', const='',
+                        help='读写按月分位数草图库，quantiles.history 跨期合并；不带路径时用 <out-root>/data/bank_quantile_sketches.json。'
+                             '不指定则不读写，history 只含本期月份')
+    parser.add_argument('--profile', action='store_true',
+                        help='记录各阶段耗时/CPU/内存峰值增量/行数，写入 data/build_profile.json 并追加 build_profile_history.jsonl')
+    parser.add_argument('--profile-cprofile', action='store_true', help='配合 --profile：每个阶段额外输出 cProfile 文件到 data/profile/')
     args = parser.parse_args()
+    parse_cache.configure(enabled=not args.no_cache, cache_dir=args.cache_dir)
+    global _CF_CLASSIFIER
+    _CF_CLASSIFIER = CfClassifier.from_file(args.cf_rules)
 
     out_root = args.out_root
     period_start = args.period_start
     period_end = args.period_end
-
-    df_sales = read_excel_guess_header(args.sales)
-    df_ar = read_excel_with_header(args.ar, header_row=1, header_rows=2)
-    df_ap = read_excel_with_header(args.ap, header_row=1, header_rows=2)
-    df_bank = read_excel_with_header(args.bank, header_row=2, header_rows=1)
-    df_inv = read_excel_with_header(args.inv, header_row=1, header_rows=2)
-    df_po = read_excel_with_header(args.po, header_row=2, header_rows=1)
-
-    sales_trend = compute_sales_trend(df_sales, df_bank, period_start, period_end)
-    bank = build_bank(df_bank, period_start, period_end)
-    bank_txns = build_bank_txns(df_bank, period_start, period_end)
-    monthly_totals, monthly_by_class = build_monthly_from_txns(bank_txns)
+    PROFILE['enabled'] = args.profile
+    if args.profile and args.profile_cprofile:
+        PROFILE['cprofile_dir'] = os.path.join(out_root, 'data', 'profile')
+    run_wall0, run_cpu0 = time.perf_counter(), time.process_time()
+
+    frames = load_workbooks({kind: getattr(args, kind) for kind in WORKBOOK_READERS}, args.workers)
+    df_sales, df_ar, df_ap, df_bank, df_inv, df_po = (frames[kind] for kind in WORKBOOK_READERS)
+
+    with profile_stage('sales_trend', len(df_sales) + len(df_bank)) as st:
+        sales_trend = compute_sales_trend(df_sales, df_bank, period_start, period_end)
+        st['rows_out'] = len(sales_trend['total']['months'])
+    with profile_stage('bank', len(df_bank)) as st:
+        bank = build_bank(df_bank, period_start, period_end)
+        st['rows_out'] = len(bank['trend']['months'])
+    with profile_stage('bank_txns', len(df_bank)) as st:
+        txn_frame = build_bank_txn_frame(df_bank, period_start, period_end)
+        bank_txns = txn_records(txn_frame)
+        st['rows_out'] = len(bank_txns)
+    with profile_stage('monthly_from_txns', len(bank_txns)) as st:
+        monthly_totals, monthly_by_class = build_monthly_from_txns(bank_txns)
+        st['rows_out'] = len(monthly_totals) + len(monthly_by_class)
     if not monthly_totals:
         months = bank.get('trend', {}).get('months', [])
         cash_in = bank.get('trend', {}).get('cash_in', [])
@@ -1446,11 +2135,14 @@ def main():
             for m, cin, cout, net in zip(months, cash_in, cash_out, net_cash)
         ]
     bank['txns'] = bank_txns
+    bank['cf_class_meta'] = get_cf_classifier().report()
     bank['monthly'] = {
         'monthly_totals': monthly_totals,
         'monthly_by_class': monthly_by_class
     }
-    po = build_po(df_po, period_start, period_end)
+    with profile_stage('po', len(df_po)) as st:
+        po = build_po(df_po, period_start, period_end)
+        st['rows_out'] = len(po['price_trends'])
 
     po_trend = {
         'months': po.get('trend', {}).get('months', []),
@@ -1458,14 +2150,21 @@ def main():
         'cash_payments': bank.get('trend', {}).get('cash_out', [])
     }
 
-    ar_segments, has_seg = build_ar_segments(df_ar, df_bank, sales_trend, period_start, period_end)
-    ap = build_ap(df_ap, df_bank, po_trend, period_start, period_end)
-    inventory = build_inventory(df_inv, period_start, period_end)
+    with profile_stage('ar_segments', len(df_ar)) as st:
+        ar_segments, has_seg = build_ar_segments(df_ar, df_bank, sales_trend, period_start, period_end)
+        st['rows_out'] = sum(len(seg['top_customers']) for seg in ar_segments.values())
+    with profile_stage('ap', len(df_ap)) as st:
+        ap = build_ap(df_ap, df_bank, po_trend, period_start, period_end)
+        st['rows_out'] = len(ap.get('top_suppliers', []))
+    with profile_stage('inventory', len(df_inv)) as st:
+        inventory = build_inventory(df_inv, period_start, period_end)
+        st['rows_out'] = len(inventory['trend']['months'])
 
     sales_total = sum((safe_number(x) or 0) for x in sales_trend['total']['sales_invoiced'])
     purchases_total = sum((safe_number(x) or 0) for x in po_trend['purchases_invoiced'])
 
-    wc = build_wc(ar_segments, ap, inventory, period_start, period_end, sales_total, purchases_total)
+    with profile_stage('wc'):
+        wc = build_wc(ar_segments, ap, inventory, period_start, period_end, sales_total, purchases_total)
 
     if inventory.get('kpi'):
         inventory['kpi']['dio_days_est'] = wc.get('kpi', {}).get('dio_days_est')
@@ -1479,13 +2178,41 @@ def main():
         'notes': []
     }
 
-    meta_notes, structured_notes = build_notes(meta, ar_segments, ap, bank, inventory, wc, period_end)
+    with profile_stage('notes') as st:
+        meta_notes, structured_notes = build_notes(meta, ar_segments, ap, bank, inventory, wc, period_end)
+        st['rows_out'] = len(structured_notes)
     if not has_seg:
         meta_notes.insert(0, '【SEG】除 AR 外均为总口径；segment 无法拆分，本期沿用 total。')
         meta['notes'] = meta_notes[:6]
 
-    risk = build_risk_and_anomalies(bank, bank_txns)
+    with profile_stage('risk', len(bank_txns)):
+        baseline_path = None
+        if args.baselines is not None:
+            baseline_path = args.baselines or os.path.join(out_root, 'data', 'counterparty_baselines.json')
+        baselines = load_baselines(baseline_path) if baseline_path else None
+        risk = build_risk_and_anomalies(bank, bank_txns, txn_frame, args.quantile_k, baselines)
     bank['risk'] = risk
+    # Anomalies depend on the stored history, so record which state this build read.
+    meta['baselines'] = None if baselines is None else {
+        'path': baseline_path,
+        'counterparties': len(baselines),
+        'months': sorted({m for entry in baselines.values() for m in entry.get('months', {})})
+    }
+    if baselines is not None:
+        with profile_stage('baselines', len(bank_txns)) as st:
+            save_baselines(baseline_path, update_baselines(baselines, txn_frame))
+            st['rows_out'] = len(baselines)
+
+    sketch_store_path = None
+    if args.sketch_store is not None:
+        sketch_store_path = args.sketch_store or os.path.join(out_root, 'data', 'bank_quantile_sketches.json')
+    with profile_stage('quantiles', len(bank_txns)) as st:
+        stored = load_sketch_store(sketch_store_path, args.quantile_k) if sketch_store_path else None
+        quantiles, sketch_months = build_txn_quantiles(txn_frame, args.quantile_k, stored)
+        if sketch_store_path:
+            save_sketch_store(sketch_store_path, args.quantile_k, sketch_months)
+        st['rows_out'] = len(quantiles['by_cf_class']) + len(quantiles['by_month']) + len(quantiles['by_counterparty'])
+    bank['quantiles'] = quantiles
 
     finance = {
         'meta': meta,
@@ -1504,27 +2231,28 @@ def main():
         'notes': structured_notes
     }
 
-    finance = sanitize(finance)
-
     finance_latest_path = os.path.join(out_root, 'data', 'finance_latest.json')
-    ensure_dirs(finance_latest_path)
-    dump_json(finance_latest_path, finance)
-
     date_tag = period_end.replace('-', '')
     fin_prefix = os.path.join(out_root, 'data', f'finance_{date_tag}')
-    v = next_version(fin_prefix)
-    fin_snapshot = f"{fin_prefix}_v{v}.json"
-    dump_json(fin_snapshot, finance)
+    with profile_stage('dump_json', len(bank_txns)):
+        finance = sanitize(finance)
+        ensure_dirs(finance_latest_path)
+        dump_json(finance_latest_path, finance)
+
+        v = next_version(fin_prefix)
+        fin_snapshot = f"{fin_prefix}_v{v}.json"
+        dump_json(fin_snapshot, finance)
 
     bp_latest_path = os.path.join(out_root, 'reports', 'bp_latest.html')
-    ensure_dirs(bp_latest_path)
-    bp_html = render_bp_html(finance, period_start, period_end, template_path=bp_latest_path)
-    with open(bp_latest_path, 'w', encoding='utf-8', newline='') as f:
-        f.write(bp_html)
+    with profile_stage('bp_html'):
+        ensure_dirs(bp_latest_path)
+        bp_html = render_bp_html(finance, period_start, period_end, template_path=bp_latest_path)
+        with open(bp_latest_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(bp_html)
 
-    bp_snapshot = os.path.join(out_root, 'reports', f"bp_{date_tag}.html")
-    with open(bp_snapshot, 'w', encoding='utf-8', newline='') as f:
-        f.write(bp_html)
+        bp_snapshot = os.path.join(out_root, 'reports', f"bp_{date_tag}.html")
+        with open(bp_snapshot, 'w', encoding='utf-8', newline='') as f:
+            f.write(bp_html)
 
     with open(finance_latest_path, 'r', encoding='utf-8') as f:
         parsed = json.load(f)
@@ -1540,6 +2268,9 @@ def main():
     print(f'top_customers: {top_customers_len} (top_n={TOP_N})')
     print(f'top_suppliers: {top_suppliers_len} (top_n={TOP_N})')
     print(f'meta.notes count: {len(meta_notes)} | severity>=warn: {warn_count}')
+    cf_meta = bank['cf_class_meta']
+    cf_hits = ', '.join(f"{k}={v}" for k, v in cf_meta['hits'].items())
+    print(f"cf rules v{cf_meta['rules_version']}: {cf_meta['distinct_triples']} distinct triples; hits {cf_hits}")
 
     snapshots = [
         {'from': 'data/finance_latest.json', 'to': os.path.relpath(fin_snapshot, out_root)},
@@ -1550,6 +2281,10 @@ def main():
     print('=== PUBLISH_PACKAGE ===')
     print(json.dumps(pkg, ensure_ascii=False, indent=2))
 
+    if args.profile:
+        write_profile(os.path.join(out_root, 'data', 'build_profile.json'), meta,
+                      time.perf_counter() - run_wall0, time.process_time() - run_cpu0)
+
 
 if __name__ == '__main__':
     sys.exit(main())
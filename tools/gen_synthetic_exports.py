@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Write synthetic ERP exports with the header layouts the build scripts read.
+
+Produces 销售利润表 (title row + header row, as scripts/build_daily_json.py expects),
+应收/应付账款明细表 and 商品收发明细表 (title row + two-row merged header, header_rows=2),
+企业收支明细表 and 采购订单 (two title rows + header row). Values are random but shaped like
+the real exports: products carry parsable 规格型号, bank lines mix operating / internal /
+financing / investing wording, and 采购订单 continuation lines leave 日期/供应商 blank.
+The same --seed always yields the same workbooks.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from openpyxl import Workbook
+
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+FILES = {
+    'sales': '销售利润表.xlsx',
+    'ar': '应收账款明细表.xlsx',
+    'ap': '应付账款明细表.xlsx',
+    'bank': '企业收支明细表.xlsx',
+    'inv': '商品收发明细表.xlsx',
+    'po': '采购订单.xlsx',
+}
+
+# Lines per export relative to --rows (销售利润表 lines); AR/AP have one line per counterparty.
+ROW_RATIOS = {'sales': 1.0, 'bank': 0.25, 'inv': 0.5, 'po': 0.2}
+
+# (name template, 规格型号, unit price range); brands are filled in per product.
+PRODUCT_TEMPLATES = [
+    ('25kg{brand}特粳米', '50斤', (95, 130)),
+    ('25kg{brand}长粒香大米', '25kg', (110, 150)),
+    ('5kg{brand}稻花香大米', '10斤', (30, 45)),
+    ('16.4L{brand}一级大豆油（非转）', '16.4L', (140, 175)),
+    ('20L{brand}纯正菜籽油', '20L', (170, 210)),
+    ('10L*2{brand}一级大豆油', '10L*2', (180, 220)),
+    ('{brand}压榨一级菜籽油5L', '5L*4', (200, 260)),
+    ('25kg{brand}特一粉', '50斤', (80, 110)),
+    ('{brand}小麦粉5kg', '10斤', (20, 30)),
+    ('袋装{brand}小米', '', (8, 15)),
+    ('散装{brand}绿豆', '斤', (4, 8)),
+]
+BRANDS = ['西瑞', '邦淇', '水鸭', '五得利', '陕富', '爱菊', '冰宝']
+CUSTOMER_CLASSES = ['超群门店', '餐饮客户', '学校食堂', '企业团餐', '批发客户']
+BANK_LINES = [
+    # (业务类型, 摘要 template, direction, share)
+    ('销售收款', '收{name}货款', 'in', 0.45),
+    ('采购付款', '付{name}货款', 'out', 0.30),
+    ('费用报销', '报销差旅费', 'out', 0.06),
+    ('内部调拨', '同名账户调拨', 'out', 0.04),
+    ('内部调拨', '内部往来款', 'in', 0.03),
+    ('银行贷款', '借款到账', 'in', 0.02),
+    ('还款', '归还贷款及利息', 'out', 0.02),
+    ('理财', '购买理财产品', 'out', 0.02),
+    ('设备购置', '购置冷库设备', 'out', 0.01),
+    ('其他', '暂挂款项', 'out', 0.03),
+    ('', '', 'out', 0.02),
+]
+
+
+def month_starts(start, months):
+    out = []
+    y, m = start.year, start.month
+    for _ in range(months):
+        out.append(date(y, m, 1))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+
+def random_day(rng, start, days):
+    return datetime.combine(start + timedelta(days=rng.randrange(days)), datetime.min.time())
+
+
+def make_catalog(rng, n_products):
+    catalog = []
+    for i in range(n_products):
+        name, spec, (lo, hi) = PRODUCT_TEMPLATES[i % len(PRODUCT_TEMPLATES)]
+        brand = BRANDS[(i // len(PRODUCT_TEMPLATES)) % len(BRANDS)]
+        suffix = '' if i < len(PRODUCT_TEMPLATES) * len(BRANDS) else f'（{i}）'
+        catalog.append({
+            'sku': f'SP{i + 1:05d}',
+            'name': name.format(brand=brand) + suffix,
+            'spec': spec,
+            'price': round(rng.uniform(lo, hi), 2),
+        })
+    return catalog
+
+
+def make_parties(prefix, n, classes=None, rng=None):
+    parties = []
+    for i in range(n):
+        party = {'code': f'{prefix[0]}{i + 1:05d}', 'name': f'{prefix}{i + 1:05d}有限公司'}
+        if classes:
+            party['cls'] = classes[rng.randrange(len(classes))]
+        parties.append(party)
+    return parties
+
+
+def new_sheet(title):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    return wb, ws
+
+
+def merged_header(ws, title, groups):
+    """Title row plus a two-row header; groups are (top, [sub, ...]) with merged top cells.
+
+    Like the ERP export, every cell under a merge still carries the header text, which is what
+    merge_headers() in build_finance_package.py relies on (empty cells read back as NaN).
+    """
+    top, sub = [], []
+    for name, subs in groups:
+        col = len(top) + 1
+        if subs:
+            top.extend([name] * len(subs))
+            sub.extend(subs)
+            if len(subs) > 1:
+                ws.merged_cells.add(f'{_col_letter(col)}2:{_col_letter(col + len(subs) - 1)}2')
+        else:
+            top.append(name)
+            sub.append(name)
+            ws.merged_cells.add(f'{_col_letter(col)}2:{_col_letter(col)}3')
+    ws.append([title])
+    ws.append(top)
+    ws.append(sub)
+
+
+def _col_letter(n):
+    s = ''
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def write_sales(path, rng, rows, months, catalog, customers):
+    wb, ws = new_sheet('销售利润表')
+    ws.append(['销售利润表'])
+    ws.append(['序号', '单据日期', '单据编号', '客户名称', '客户分类', '商品编码', '商品名称', '规格型号', '单位',
+               '数量', '实际含税单价', '价税合计', '成本', '销售毛利', '关联销售费用', '备注'])
+    per_month = max(1, rows // len(months))
+    seq = 0
+    for mi, start in enumerate(months):
+        n = per_month if mi < len(months) - 1 else rows - per_month * (len(months) - 1)
+        days = (month_starts(start, 2)[1] - start).days
+        dates = sorted(random_day(rng, start, days) for _ in range(n))
+        order_no, order_day, order_seq, left, cust = '', None, 0, 0, None
+        for dt in dates:
+            if left <= 0 or dt != order_day:
+                order_seq = order_seq + 1 if dt == order_day else 1
+                order_day = dt
+                order_no = f"XSFP-{dt.strftime('%Y%m%d')}-{order_seq:05d}"
+                left = rng.choice((1, 1, 2, 3, 5, 8))
+                cust = customers[rng.randrange(len(customers))]
+            left -= 1
+            seq += 1
+            p = catalog[rng.randrange(len(catalog))]
+            qty = rng.choice((1, 2, 5, 10, 20, 50, 100)) * (-1 if rng.random() < 0.01 else 1)
+            price = round(p['price'] * rng.uniform(0.95, 1.05), 2)
+            amount = round(qty * price, 2)
+            cost = round(amount * rng.uniform(0.85, 0.97), 2)
+            fee = round(amount * 0.01, 2) if rng.random() < 0.1 else 0
+            ws.append([seq, dt, order_no, cust['name'], cust['cls'], p['sku'], p['name'], p['spec'], '袋',
+                       qty, price, amount, cost, round(amount - cost, 2), fee, None])
+    wb.save(path)
+    return seq
+
+
+def write_ar(path, rng, customers):
+    wb, ws = new_sheet('应收账款明细表')
+    merged_header(ws, '应收账款明细表', [
+        ('客户编码', None), ('客户名称', None), ('客户类型', None),
+        ('期初', ['应收净额']),
+        ('本期', ['销售应收', '收款']),
+        ('期末', ['销售应收', '其他应收', '预收', '应收净额']),
+    ])
+    for c in customers:
+        opening = round(rng.uniform(0, 200_000), 2)
+        sales = round(rng.uniform(0, 500_000), 2)
+        received = round(min(opening + sales, sales * rng.uniform(0.7, 1.1)), 2)
+        other = round(rng.uniform(0, 5_000), 2) if rng.random() < 0.2 else 0
+        pre = round(rng.uniform(0, 20_000), 2) if rng.random() < 0.1 else 0
+        end_sales = round(opening + sales - received, 2)
+        seg = '门店客户' if c['cls'] == '超群门店' else '非门店客户'
+        ws.append([c['code'], c['name'], seg, opening, sales, received, end_sales, other, pre,
+                   round(end_sales + other - pre, 2)])
+    wb.save(path)
+    return len(customers)
+
+
+def write_ap(path, rng, suppliers):
+    wb, ws = new_sheet('应付账款明细表')
+    merged_header(ws, '应付账款明细表', [
+        ('供应商名称', None), ('供应商编码', None),
+        ('期初', ['应付净额']),
+        ('本期', ['采购应付', '付款']),
+        ('期末', ['采购应付', '其他应付', '预付', '应付净额']),
+    ])
+    for s in suppliers:
+        opening = round(rng.uniform(0, 300_000), 2)
+        purchases = round(rng.uniform(0, 800_000), 2)
+        paid = round(min(opening + purchases, purchases * rng.uniform(0.7, 1.1)), 2)
+        other = round(rng.uniform(0, 8_000), 2) if rng.random() < 0.2 else 0
+        prepay = round(rng.uniform(0, 30_000), 2) if rng.random() < 0.1 else 0
+        end_purchase = round(opening + purchases - paid, 2)
+        ws.append([s['name'], s['code'], opening, purchases, paid, end_purchase, other, prepay,
+                   round(end_purchase + other - prepay, 2)])
+    wb.save(path)
+    return len(suppliers)
+
+
+def write_bank(path, rng, rows, months, customers, suppliers):
+    wb, ws = new_sheet('企业收支明细表')
+    ws.append(['企业收支明细表'])
+    ws.append([f"期间：{months[0].isoformat()} 至 {(month_starts(months[-1], 2)[1] - timedelta(days=1)).isoformat()}"])
+    ws.append(['日期', '账户名称', '收入(本位币)', '支出(本位币)', '业务类型', '对方单位', '摘要', '对账状态'])
+    kinds = [k for k in BANK_LINES]
+    weights = [k[3] for k in kinds]
+    span = (month_starts(months[-1], 2)[1] - months[0]).days
+    dates = sorted(random_day(rng, months[0], span) for _ in range(rows))
+    for dt in dates:
+        typ, memo, direction, _ = rng.choices(kinds, weights)[0]
+        if typ == '销售收款':
+            name = customers[rng.randrange(len(customers))]['name']
+        elif typ == '采购付款':
+            name = suppliers[rng.randrange(len(suppliers))]['name']
+        elif typ == '内部调拨':
+            name = '本公司其他账户'
+        elif typ in ('银行贷款', '还款'):
+            name = '某商业银行'
+        else:
+            name = '' if not typ else f'服务商{rng.randrange(50):03d}'
+        amount = round(rng.lognormvariate(9, 1.2), 2)
+        status = rng.choice(('已对账', '已对账', '已对账', '未对账', ''))
+        ws.append([dt, '基本户', amount if direction == 'in' else None, amount if direction == 'out' else None,
+                   typ, name, memo.format(name=name), status])
+    wb.save(path)
+    return rows
+
+
+def write_inv(path, rng, rows, months, catalog):
+    wb, ws = new_sheet('商品收发明细表')
+    merged_header(ws, '商品收发明细表', [
+        ('日期', None), ('商品编码', None), ('商品名称', None),
+        ('期初', ['数量', '成本']),
+        ('入库', ['数量', '成本']),
+        ('出库', ['数量', '成本']),
+        ('期末', ['数量', '库存成本']),
+    ])
+    span = (month_starts(months[-1], 2)[1] - months[0]).days
+    stock = {p['sku']: rng.randrange(100, 2000) for p in catalog}
+    dates = sorted(random_day(rng, months[0], span) for _ in range(rows))
+    for dt in dates:
+        p = catalog[rng.randrange(len(catalog))]
+        unit_cost = p['price'] * 0.9
+        opening = stock[p['sku']]
+        inbound = rng.choice((0, 0, 50, 100, 200))
+        outbound = min(opening + inbound, rng.randrange(0, 150))
+        ending = opening + inbound - outbound
+        stock[p['sku']] = ending
+        ws.append([dt, p['sku'], p['name'], opening, round(opening * unit_cost, 2), inbound,
+                   round(inbound * unit_cost, 2), outbound, round(outbound * unit_cost, 2), ending,
+                   round(ending * unit_cost, 2)])
+    wb.save(path)
+    return rows
+
+
+def write_po(path, rng, rows, months, catalog, suppliers):
+    wb, ws = new_sheet('采购订单')
+    ws.append(['采购订单'])
+    ws.append(['制表：系统导出'])
+    ws.append(['单据日期', '单据编号', '供应商', '商品编码', '商品名称', '规格型号', '数量', '单价', '金额'])
+    span = (month_starts(months[-1], 2)[1] - months[0]).days
+    written = 0
+    order = 0
+    while written < rows:
+        order += 1
+        dt = random_day(rng, months[0], span)
+        sup = suppliers[rng.randrange(len(suppliers))]
+        for line in range(min(rows - written, rng.choice((1, 2, 3, 4)))):
+            p = catalog[rng.randrange(len(catalog))]
+            qty = rng.choice((50, 100, 200, 500))
+            price = round(p['price'] * rng.uniform(0.8, 0.92), 2)
+            # Continuation lines of one order leave 日期/编号/供应商 empty, as the ERP export does.
+            head = [dt, f'CGDD-{order:07d}', sup['name']] if line == 0 else [None, None, None]
+            ws.append(head + [p['sku'], p['name'], p['spec'], qty, price, round(qty * price, 2)])
+            written += 1
+    wb.save(path)
+    return written
+
+
+def generate(out_dir, rows, start='2025-01-01', months=12, seed=7, only=None):
+    """Write the exports into out_dir; returns {kind: (path, lines)}."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    month_list = month_starts(datetime.strptime(start, '%Y-%m-%d').date(), months)
+    catalog = make_catalog(rng, max(len(PRODUCT_TEMPLATES), min(2000, rows // 200)))
+    customers = make_parties('客户', max(50, min(20_000, rows // 50)), CUSTOMER_CLASSES, rng)
+    suppliers = make_parties('供应商', max(20, min(2_000, rows // 500)))
+    kinds = only or list(FILES)
+    results = {}
+    for kind in kinds:
+        # One stream per export, so regenerating a subset leaves the other files' data unchanged.
+        rng = random.Random(f'{seed}:{kind}')
+        path = out_dir / FILES[kind]
+        n = int(rows * ROW_RATIOS.get(kind, 0))
+        if kind == 'sales':
+            lines = write_sales(path, rng, n, month_list, catalog, customers)
+        elif kind == 'ar':
+            lines = write_ar(path, rng, customers)
+        elif kind == 'ap':
+            lines = write_ap(path, rng, suppliers)
+        elif kind == 'bank':
+            lines = write_bank(path, rng, n, month_list, customers, suppliers)
+        elif kind == 'inv':
+            lines = write_inv(path, rng, n, month_list, catalog)
+        else:
+            lines = write_po(path, rng, n, month_list, catalog, suppliers)
+        results[kind] = (path, lines)
+    return results
+
+
+def period_of(start='2025-01-01', months=12):
+    first = month_starts(datetime.strptime(start, '%Y-%m-%d').date(), months + 1)
+    return first[0].isoformat(), (first[-1] - timedelta(days=1)).isoformat()
+
+
+def parse_rows(val):
+    key = str(val).lower()
+    return SCALES[key] if key in SCALES else int(val)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic ERP exports for benchmarking the builders.')
+    parser.add_argument('--out-dir', required=True, help='输出目录')
+    parser.add_argument('--rows', default='10k', help='销售利润表行数：10k / 100k / 1m 或具体数字，其他表按比例缩放')
+    parser.add_argument('--start', default='2025-01-01', help='首月 YYYY-MM-DD')
+    parser.add_argument('--months', type=int, default=12, help='覆盖月数')
+    parser.add_argument('--seed', type=int, default=7, help='随机种子（相同种子生成相同数据）')
+    parser.add_argument('--only', nargs='+', choices=list(FILES), help='只生成指定的表')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    results = generate(args.out_dir, parse_rows(args.rows), args.start, args.months, args.seed, args.only)
+    for kind, (path, lines) in results.items():
+        print(f"{kind:<6} {lines:>9} lines  {path}")
+    print(f"Generated in {time.perf_counter() - t0:.1f}s; period {' ~ '.join(period_of(args.start, args.months))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""First-match keyword rules compiled into one regex scan.
+
+Shared by the sales Categorizer (scripts/category_rules.json) and the finance CfClassifier
+(tools/cf_rules.json). A rules file is {"version", "default", "rules": [{<label_key>, "keywords",
+"exclude"?}, ...]}; the first rule with a keyword in the text and none of its excludes wins.
+
+The pattern is a lookahead alternation (longest keyword first), so every start position reports
+its longest keyword. Each keyword is credited with all rule keywords it contains, which makes the
+result identical to running `any(k in text for k in keywords)` rule by rule.
+"""
+import json
+import re
+
+
+class KeywordRules:
+    """Subclasses set `label_key` (the rule field naming the result) and `default_label`; they
+    memoize classify() results per distinct key in `_memo`. `hits` starts at zero for every label,
+    for subclasses that count results as they classify."""
+
+    label_key = 'label'
+    default_label = None
+
+    def __init__(self, rules, default=None, version=None):
+        self.rules = [dict(r) for r in rules]
+        self.default = self.default_label if default is None else default
+        self.version = version
+        tokens = {}
+        for i, rule in enumerate(self.rules):
+            for k in rule.get('keywords', []):
+                tokens.setdefault(k, set()).add(('kw', i))
+            for k in rule.get('exclude', []):
+                tokens.setdefault(k, set()).add(('ex', i))
+        self._implied = {
+            k: set().union(*(v for sub, v in tokens.items() if sub in k))
+            for k in tokens
+        }
+        alternation = '|'.join(re.escape(k) for k in sorted(tokens, key=len, reverse=True))
+        self._pattern = re.compile(f'(?=({alternation}))') if tokens else None
+        self._memo = {}
+        self.hits = {r[self.label_key]: 0 for r in self.rules}
+        self.hits[self.default] = 0
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            cfg = json.load(f)
+        return cls(cfg.get('rules', []), default=cfg.get('default', cls.default_label), version=cfg.get('version'))
+
+    def classify(self, text):
+        found = set()
+        if self._pattern is not None:
+            for m in self._pattern.finditer(text):
+                found |= self._implied[m.group(1)]
+        for i, rule in enumerate(self.rules):
+            if ('kw', i) in found and ('ex', i) not in found:
+                return rule[self.label_key]
+        return self.default
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""On-disk cache of parsed Excel inputs shared by the build scripts.
+
+Entries are pickled (fast binary, keeps DataFrame dtypes and datetimes) and keyed by the
+sha256 of the source file plus the reader parameters, so any edit to a workbook or a change
+of sheet/header settings is a miss. The directory is bounded by total size; the least
+recently used entries (by mtime, refreshed on every hit) are evicted first.
+"""
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+
+
+CACHE_VERSION = 1
+DEFAULT_DIR = Path('.cache/parsed')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_config = {'enabled': True, 'dir': DEFAULT_DIR, 'max_bytes': DEFAULT_MAX_BYTES}
+_sha_memo = {}
+
+
+def configure(enabled=None, cache_dir=None, max_bytes=None):
+    if enabled is not None:
+        _config['enabled'] = bool(enabled)
+    if cache_dir is not None:
+        _config['dir'] = Path(cache_dir)
+    if max_bytes is not None:
+        _config['max_bytes'] = int(max_bytes)
+
+
+def file_sha256(path):
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _sha_memo.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = _sha_memo[memo_key] = h.hexdigest()
+    return digest
+
+
+def cache_key(path, params):
+    payload = json.dumps({'v': CACHE_VERSION, 'sha256': file_sha256(path), 'params': params},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def evict(cache_dir=None, max_bytes=None):
+    cache_dir = Path(cache_dir or _config['dir'])
+    max_bytes = _config['max_bytes'] if max_bytes is None else max_bytes
+    if not cache_dir.exists():
+        return 0
+    entries = []
+    for p in cache_dir.glob('*.pkl'):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, p in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def cached(path, params, build):
+    """Return build() for `path`, reusing a previous result when the file and params are unchanged."""
+    if not _config['enabled']:
+        return build()
+    cache_dir = Path(_config['dir'])
+    entry = cache_dir / f"{cache_key(path, params)}.pkl"
+    if entry.exists():
+        try:
+            with entry.open('rb') as f:
+                value = pickle.load(f)
+            os.utime(entry)
+            return value
+        except Exception:
+            entry.unlink(missing_ok=True)
+
+    value = build()
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, entry)
+        evict(cache_dir)
+    except OSError as exc:
+        print(f"Parse cache write skipped for {path}: {exc}")
+    return value
+
+
+CHUNK_ITEMS = 10000
+
+
+def cached_iter(path, params, build):
+    """Like cached() for a sequence: yields the items of build() (an iterable) one at a time.
+
+    The entry is stored as consecutive pickled chunks of CHUNK_ITEMS items, so neither a miss
+    nor a hit holds the whole sequence in memory. A miss is only committed once build() has
+    been consumed to the end.
+    """
+    if not _config['enabled']:
+        yield from build()
+        return
+    cache_dir = Path(_config['dir'])
+    entry = cache_dir / f"{cache_key(path, params)}.pkl"
+    if entry.exists():
+        yielded = 0
+        try:
+            with entry.open('rb') as f:
+                os.utime(entry)
+                while True:
+                    try:
+                        chunk = pickle.load(f)
+                    except EOFError:
+                        break
+                    for item in chunk:
+                        yielded += 1
+                        yield item
+            return
+        except Exception:
+            entry.unlink(missing_ok=True)
+            if yielded:
+                raise
+
+    tmp = entry.with_suffix(f'.{os.getpid()}.tmp')
+    f = None
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        f = tmp.open('wb')
+    except OSError as exc:
+        print(f"Parse cache write skipped for {path}: {exc}")
+    try:
+        chunk = []
+        for item in build():
+            if f is not None:
+                chunk.append(item)
+                if len(chunk) >= CHUNK_ITEMS:
+                    pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    chunk = []
+            yield item
+        if f is not None:
+            if chunk:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.close()
+            f = None
+            os.replace(tmp, entry)
+            evict(cache_dir)
+    finally:
+        if f is not None:
+            f.close()
+            tmp.unlink(missing_ok=True)
@@ -132,6 +132,17 @@ function createOrderLink(segKey, type, title, info, text) {
 let _orderModalCache = [];
 let _orderModalView = [];
 let _orderModalTitle = '订单明细';
+let _orderModalSeg = '';
+
+// Precomputed order totals from the segment's order_index (app.js); null when unavailable.
+function _orderTotals(segKey, orderNo) {
+  if (!segKey || typeof getOrderTotals !== 'function') return null;
+  try { return getOrderTotals(segKey, orderNo); } catch (e) { return null; }
+}
+
+function _orderTotalsText(t) {
+  return `${t.date}｜销售额 ${fmtNum(t.sales)}｜毛利 ${fmtNum(t.gp)}｜数量 ${fmtNum(t.qty)}｜${t.lines} 行`;
+}
 
 let _toastTimer = null;
 function _flashToast(msg) {
@@ -172,7 +183,10 @@ function _renderOrderModal() {
     btn.type = 'button';
     btn.className = 'order-pill';
     btn.dataset.order = String(o);
-    btn.innerHTML = `<span class="order-no">${escapeHtml(o)}</span><span class="mini">⧉</span>`;
+    const totals = _orderTotals(_orderModalSeg, o);
+    const meta = totals ? `<span class="mini">${escapeHtml(fmtWan(totals.sales))}｜${totals.lines} 行</span>` : '';
+    btn.innerHTML = `<span class="order-no">${escapeHtml(o)}</span>${meta}<span class="mini">⧉</span>`;
+    if (totals) btn.title = _orderTotalsText(totals);
     frag.appendChild(btn);
   });
   list.appendChild(frag);
@@ -213,10 +227,11 @@ function _ensureOrderModalHandlers() {
   });
 }
 
-function showOrderModal(title, orders) {
-  if (openDetailPanel(title, orders)) return;
+function showOrderModal(title, orders, segKey) {
+  if (openDetailPanel(title, orders, segKey)) return;
   const modal = document.getElementById('order_modal');
   if (!modal) return;
+  _orderModalSeg = segKey || '';
   _orderModalTitle = title || '订单明细';
   _orderModalCache = (orders || []).slice();
   const input = document.getElementById('order_modal_search');
@@ -229,7 +244,43 @@ function showOrderModal(title, orders) {
   if (input) setTimeout(() => { try { input.focus(); } catch (e) { } }, 60);
 }
 
-function openDetailPanel(title, orders) {
+// Lines of one order, read through the order index so the cost is the order's own line count.
+function _renderOrderLines(container, segKey, orderNo) {
+  container.innerHTML = '';
+  if (!segKey || typeof getOrderLines !== 'function') return;
+  const lines = getOrderLines(segKey, orderNo);
+  if (!lines.length) return;
+  const table = document.createElement('table');
+  table.className = 'drawer-table';
+  const head = document.createElement('tr');
+  ['商品', '品类', '数量', '单价', '销售额', '毛利', '扣费毛利'].forEach(h => {
+    const th = document.createElement('th');
+    th.textContent = h;
+    head.appendChild(th);
+  });
+  const thead = document.createElement('thead');
+  thead.appendChild(head);
+  table.appendChild(thead);
+  const tbody = document.createElement('tbody');
+  lines.forEach(r => {
+    const tr = document.createElement('tr');
+    [r[6], r[7], fmtNum(r[8]), fmtNum(r[14]), fmtNum(r[9]), fmtNum(r[12]), fmtNum(r[13])].forEach(c => {
+      const td = document.createElement('td');
+      td.textContent = c;
+      tr.appendChild(td);
+    });
+    tbody.appendChild(tr);
+  });
+  table.appendChild(tbody);
+  const caption = document.createElement('div');
+  caption.className = 'ctl';
+  const totals = _orderTotals(segKey, orderNo);
+  caption.textContent = orderNo + (totals ? '｜' + _orderTotalsText(totals) : '');
+  container.appendChild(caption);
+  container.appendChild(table);
+}
+
+function openDetailPanel(title, orders, segKey) {
   const panel = document.getElementById('explorer_detail_panel');
   const body = document.getElementById('detail_body');
   const titleEl = document.getElementById('detail_title');
@@ -238,6 +289,8 @@ function openDetailPanel(title, orders) {
   body.innerHTML = '';
   const list = document.createElement('div');
   list.className = 'order-grid';
+  const lines = document.createElement('div');
+  lines.className = 'order-lines';
   const data = (orders || []).slice();
   if (!data.length) {
     body.textContent = '暂无明细';
@@ -247,7 +300,10 @@ function openDetailPanel(title, orders) {
       pill.type = 'button';
       pill.className = 'order-pill';
       pill.textContent = String(o);
+      const totals = _orderTotals(segKey, o);
+      if (totals) pill.title = _orderTotalsText(totals);
       pill.addEventListener('click', () => {
+        _renderOrderLines(lines, segKey, o);
         if (navigator.clipboard && navigator.clipboard.writeText) {
           navigator.clipboard.writeText(String(o)).then(() => _flashToast('已复制：' + o)).catch(() => { });
         }
@@ -255,6 +311,7 @@ function openDetailPanel(title, orders) {
       list.appendChild(pill);
     });
     body.appendChild(list);
+    body.appendChild(lines);
   }
   panel.classList.remove('hidden');
   panel.setAttribute('aria-hidden', 'false');
@@ -304,7 +361,7 @@ document.addEventListener('click', (e) => {
   let info = {};
   try { info = JSON.parse(link.dataset.info || '{}'); } catch (err) { info = {}; }
   const orders = getOrderList(segKey, type, info);
-  showOrderModal(title, orders);
+  showOrderModal(title, orders, segKey);
 });
 
 // ===== 表头筛选（所有列表） =====